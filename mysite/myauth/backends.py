@@ -0,0 +1,21 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .permissions import get_cached_permissions
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that keeps the resolved permissions of every user in PERMISSION_CACHE,
+    so has_perm() in views and {{ perms }} in templates query the database only after
+    the user's groups or permissions have changed (see myauth.signals).
+    """
+
+    def get_all_permissions(self, user_obj, obj = None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = get_cached_permissions(
+                user_obj.pk,
+                lambda: super(CachedModelBackend, self).get_all_permissions(user_obj),
+            )
+        return user_obj._perm_cache
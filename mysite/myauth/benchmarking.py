@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from shopapp.benchmarking import get_body, measure
+
+
+def benchmark_session_backends(repeat: int) -> dict:
+    """
+    Times an authenticated page, a session read and a session write for every
+    backend in SESSION_ENGINES. The query counts show the session table traffic.
+    """
+    user = User.objects.create_user(username = 'bench-session-user', password = '!')
+    urls = {
+        'authenticated_page': reverse('myauth:about-me'),
+        'session_read': reverse('myauth:get_session'),
+        'session_write': reverse('myauth:set_session'),
+    }
+    report = {}
+    try:
+        for backend, engine in settings.SESSION_ENGINES.items():
+            with override_settings(SESSION_ENGINE = engine):
+                caches[settings.SESSION_CACHE_ALIAS].clear()
+                client = Client()
+                client.force_login(user)
+                results = {
+                    name: dict(measure(lambda: get_body(client, url), repeat), url = url)
+                    for name, url in urls.items()
+                }
+                cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+                results['cookie_bytes'] = len(cookie)
+                report[backend] = results
+    finally:
+        user.delete()
+    return report
@@ -0,0 +1,41 @@
+import json
+import tempfile
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from myauth.benchmarking import benchmark_session_backends
+from mysite.testing import isolated_caches
+
+
+class Command(BaseCommand):
+    """
+    Compares the per-request cost of the session backends on a throwaway test database.
+    Prints JSON, like benchmark_shop.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type = int, default = 200, help = 'Timed requests per page and backend')
+        parser.add_argument('--output', help = 'Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity = 0, autoclobber = True)
+        try:
+            # file caches of its own, the site's must not see sessions of a throwaway database
+            with tempfile.TemporaryDirectory() as cache_dir, override_settings(
+                CACHES = isolated_caches(cache_dir), RATE_LIMIT_DEFAULT = None, RATE_LIMITS = {},
+            ):
+                backends = benchmark_session_backends(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity = 0)
+            teardown_test_environment()
+
+        data = json.dumps({'repeat': options['repeat'], 'backends': backends}, indent = 2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(data)
+            self.stdout.write(self.style.SUCCESS(f'Benchmark report written to {options["output"]}'))
+        else:
+            self.stdout.write(data)
@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    """
+    Deletes expired sessions from the session table in small batches.
+    Unlike clearsessions, which runs one DELETE over the whole table, every batch
+    is a short transaction, so logins and session writes are not blocked meanwhile.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 1000)
+        parser.add_argument('--max-batches', type = int, help = 'Stop after this many batches')
+        parser.add_argument('--sleep', type = float, default = 0, help = 'Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        if settings.SESSION_ENGINE == settings.SESSION_ENGINES['signed_cookies']:
+            self.stdout.write('Signed cookie sessions are not stored on the server')
+            return
+        # sessions that expire while the command runs are left for the next run
+        now = timezone.now()
+        batches = 0
+        deleted = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            keys = list(
+                Session.objects
+                .filter(expire_date__lt = now)
+                .values_list('session_key', flat = True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            with transaction.atomic():
+                deleted += Session.objects.filter(session_key__in = keys, expire_date__lt = now).delete()[0]
+            batches += 1
+            self.stdout.write(f'Deleted {deleted} expired sessions')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Expired sessions deleted: {deleted}'))
@@ -0,0 +1,69 @@
+import time
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+PERMISSIONS_VERSION_KEY = 'myauth:permissions-version'
+
+
+def get_permission_cache():
+    return caches[settings.PERMISSION_CACHE]
+
+
+def user_version_key(user_pk: int) -> str:
+    return f'myauth:permissions-version:user:{user_pk}'
+
+
+def get_permission_versions(user_pk: int) -> tuple[int, int]:
+    """
+    The global version and the version of the user, which change whenever the
+    permissions of the user may have. A missing version is seeded with the clock:
+    after a cull it must not come back as a value some entry cached before a revoke
+    is still stored under.
+    """
+    cache = get_permission_cache()
+    user_key = user_version_key(user_pk)
+    versions = cache.get_many([PERMISSIONS_VERSION_KEY, user_key])
+    global_version = versions.get(PERMISSIONS_VERSION_KEY)
+    if global_version is None:
+        global_version = cache.get_or_set(PERMISSIONS_VERSION_KEY, time.time_ns, timeout = None)
+    user_version = versions.get(user_key)
+    if user_version is None:
+        user_version = cache.get_or_set(user_key, time.time_ns, timeout = None)
+    return global_version, user_version
+
+
+def get_cached_permissions(user_pk: int, load: Callable[[], set]) -> set:
+    """
+    The permission names of a user, from the cache or from load(), keyed by
+    get_permission_versions() so that bumping a version retires them
+    """
+    cache = get_permission_cache()
+    global_version, user_version = get_permission_versions(user_pk)
+    key = f'myauth:permissions:{user_pk}:{global_version}:{user_version}'
+    permissions = cache.get(key)
+    if permissions is None:
+        permissions = load()
+        cache.set(key, permissions, timeout = settings.PERMISSION_CACHE_TIMEOUT)
+    return permissions
+
+
+def bump_permissions_version(user_pks: Optional[Iterable[int]] = None) -> None:
+    """
+    Retires the cached permissions of these users, or of every user, once the current
+    transaction commits. Bumping before that would let a request in between cache
+    the old permissions under the new version for PERMISSION_CACHE_TIMEOUT.
+    """
+    keys = [PERMISSIONS_VERSION_KEY] if user_pks is None else [user_version_key(pk) for pk in user_pks]
+    transaction.on_commit(lambda: _bump_versions(keys))
+
+
+def _bump_versions(keys: list) -> None:
+    cache = get_permission_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout = None)
@@ -0,0 +1,41 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .permissions import bump_permissions_version
+
+
+@receiver(m2m_changed, sender = User.groups.through)
+@receiver(m2m_changed, sender = User.user_permissions.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_permissions_version([instance.pk])
+    elif action == 'post_clear' or sender is User.user_permissions.through:
+        # the users of a cleared group, or of a permission, are not at hand
+        bump_permissions_version()
+    else:
+        bump_permissions_version(pk_set)
+
+
+@receiver(m2m_changed, sender = Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_permissions_version()
+
+
+@receiver(post_save, sender = User)
+def user_saved(sender, instance, update_fields, **kwargs):
+    # is_superuser and is_active change what the backend returns; logins only touch last_login
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_permissions_version([instance.pk])
+
+
+@receiver(post_save, sender = Group)
+@receiver(post_delete, sender = Group)
+@receiver(post_save, sender = Permission)
+@receiver(post_delete, sender = Permission)
+def permissions_table_changed(sender, **kwargs):
+    bump_permissions_version()
@@ -1,5 +1,20 @@
-from django.test import TestCase
+import datetime
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.sessions.models import Session
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from myauth.benchmarking import benchmark_session_backends
+from myauth.permissions import get_permission_cache, user_version_key
+from shopapp.models import Order
 
 
 # Create your tests here.
@@ -17,4 +32,136 @@ class FooBarViewTestCase(TestCase):
             response.headers['content-type'], 'application/json'
         )
         expected_data = {'foo': 'bar', 'spam': 'eggs'}
-        self.assertJSONEqual(response.content,expected_data)
\ No newline at end of file
+        self.assertJSONEqual(response.content,expected_data)
+
+@override_settings(RATE_LIMIT_DEFAULT = None)
+class SessionBackendsTestCase(TestCase):
+    def test_session_round_trip(self):
+        for backend, engine in settings.SESSION_ENGINES.items():
+            with self.subTest(backend = backend), override_settings(SESSION_ENGINE = engine):
+                self.client.get(reverse('myauth:set_session'))
+                response = self.client.get(reverse('myauth:get_session'))
+                self.assertContains(response, "'fizz buzz'")
+                self.client.cookies.clear()
+
+    def test_benchmark(self):
+        report = benchmark_session_backends(repeat = 1)
+        self.assertEqual(set(report), set(settings.SESSION_ENGINES))
+        self.assertEqual(report['signed_cookies']['session_write']['queries'], 0)
+
+
+class ClearExpiredSessionsTestCase(TestCase):
+    def setUp(self) -> None:
+        now = timezone.now()
+        Session.objects.bulk_create(
+            Session(
+                session_key = f'session-{i}',
+                session_data = '',
+                expire_date = now + datetime.timedelta(days = -1 if i % 2 else 1),
+            )
+            for i in range(10)
+        )
+
+    @override_settings(SESSION_ENGINE = 'django.contrib.sessions.backends.db')
+    def test_clear_expired_sessions(self):
+        call_command('clear_expired_sessions', batch_size = 2, max_batches = 1, stdout = StringIO())
+        self.assertEqual(Session.objects.count(), 8)
+        call_command('clear_expired_sessions', batch_size = 2, stdout = StringIO())
+        self.assertEqual(
+            sorted(Session.objects.values_list('session_key', flat = True)),
+            [f'session-{i}' for i in range(0, 10, 2)],
+        )
+
+
+@override_settings(RATE_LIMIT_DEFAULT = None)
+class CachedPermissionsTestCase(TestCase):
+    def setUp(self) -> None:
+        get_permission_cache().clear()
+        self.user = User.objects.create_user(username = 'bob-test', password = '12345')
+        self.group = Group.objects.create(name = 'order_viewers')
+        self.view_order = Permission.objects.get(codename = 'view_order')
+
+    def has_perm(self, perm: str) -> bool:
+        # a fresh instance, as on a new request
+        return User.objects.get(pk = self.user.pk).has_perm(perm)
+
+    def test_permissions_are_cached(self):
+        self.user.user_permissions.add(self.view_order)
+        self.assertTrue(self.has_perm('shopapp.view_order'))
+        user = User.objects.get(pk = self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('shopapp.view_order'))
+            self.assertFalse(user.has_perm('shopapp.change_order'))
+
+    def test_group_changes_invalidate(self):
+        self.assertFalse(self.has_perm('shopapp.view_order'))
+        with self.captureOnCommitCallbacks(execute = True):
+            self.user.groups.add(self.group)
+            self.group.permissions.add(self.view_order)
+        self.assertTrue(self.has_perm('shopapp.view_order'))
+        with self.captureOnCommitCallbacks(execute = True):
+            self.group.user_set.remove(self.user)
+        self.assertFalse(self.has_perm('shopapp.view_order'))
+        with self.captureOnCommitCallbacks(execute = True):
+            self.group.user_set.add(self.user)
+            self.group.permissions.clear()
+        self.assertFalse(self.has_perm('shopapp.view_order'))
+
+    def test_version_changes_on_commit_only(self):
+        self.assertFalse(self.has_perm('shopapp.view_order'))
+        cache = get_permission_cache()
+        version = cache.get(user_version_key(self.user.pk))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.user_permissions.add(self.view_order)
+            self.assertEqual(cache.get(user_version_key(self.user.pk)), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(user_version_key(self.user.pk)), version)
+        self.assertTrue(self.has_perm('shopapp.view_order'))
+
+    def test_culled_version_does_not_bring_back_revoked_permissions(self):
+        with self.captureOnCommitCallbacks(execute = True):
+            self.user.user_permissions.add(self.view_order)
+        self.assertTrue(self.has_perm('shopapp.view_order'))
+        with self.captureOnCommitCallbacks(execute = True):
+            self.user.user_permissions.remove(self.view_order)
+        # the cache drops the user's version key, as a cull would
+        get_permission_cache().delete(user_version_key(self.user.pk))
+        self.assertFalse(self.has_perm('shopapp.view_order'))
+
+    def test_tests_do_not_use_the_site_cache(self):
+        self.assertNotIsInstance(get_permission_cache(), FileBasedCache)
+
+    def test_order_details_page_does_not_query_permissions(self):
+        self.user.user_permissions.add(self.view_order)
+        order = Order.objects.create(delivery_address = 'Test street', user = self.user)
+        self.client.force_login(self.user)
+        url = reverse('shopapp:order_details', kwargs = {'pk': order.pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([query for query in context.captured_queries if 'auth_permission' in query['sql']])
+
+
+class UserAdminSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username = 'admin-test', password = '12345')
+        cls.user = User.objects.create_user(
+            username = 'bob-search', email = 'robert@example.com', first_name = 'Robert', last_name = 'Smith',
+        )
+
+    def setUp(self) -> None:
+        self.client.force_login(self.admin)
+
+    def test_changelist_searches_email_and_names(self):
+        url = reverse('admin:auth_user_changelist')
+        for term in ('robert@example', 'Smith', 'BOB'):
+            response = self.client.get(url, {'q': term})
+            self.assertEqual(list(response.context['cl'].result_list), [self.user])
+
+    def test_autocomplete_searches_username_prefix(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'shopapp', 'model_name': 'order', 'field_name': 'user', 'term': 'bob',
+        })
+        self.assertEqual([result['text'] for result in response.json()['results']], ['bob-search'])
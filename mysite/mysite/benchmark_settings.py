@@ -0,0 +1,11 @@
+"""
+Settings of the servers started by the benchmark_asgi command
+"""
+from .settings import *  # noqa: F401,F403
+
+# DEBUG keeps every query in memory and adds its own overhead
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+# the load comes from a single client, which the rate limiter would block after a few requests
+RATE_LIMIT_DEFAULT = None
+RATE_LIMITS = {}
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import hashlib
 from pathlib import Path
 
 from django.urls import reverse_lazy
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'requestdataapp.middlewares.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,7 +54,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
-    'requestdataapp.middlewares.CountRequestMiddlewares'
+    'requestdataapp.middlewares.RateLimitMiddleware'
 ]
 
 ROOT_URLCONF = 'mysite.urls'
@@ -85,6 +87,104 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The on-disk caches outlive the process and are found by everything started with these
+# settings, so their keys are scoped to the database the entries were computed from.
+# Tests and benchmarks run on throwaway databases and get caches of their own, see mysite.testing
+
+CACHE_KEY_PREFIX = hashlib.sha256(str(DATABASES['default']['NAME']).encode()).hexdigest()[:12]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by all worker processes on the host, so invalidation reaches every worker
+    'shop': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'shop',
+        'KEY_PREFIX': CACHE_KEY_PREFIX,
+    },
+    # cached_db sessions must not come from a per-process cache, or workers would read stale data.
+    # Point it at memcached or redis when the site runs on more than one host.
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'sessions',
+        'KEY_PREFIX': CACHE_KEY_PREFIX,
+    },
+    'permissions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'permissions',
+        'KEY_PREFIX': CACHE_KEY_PREFIX,
+    },
+}
+
+# Sessions
+# 'db' reads the session table on every request that uses the session and writes it on every change.
+# 'cached_db' reads from the sessions cache and only falls back to the table on a miss,
+# writes still go to both. 'signed_cookies' keeps the session in the client's cookie:
+# no server storage at all, but the data is limited to ~4 KB, readable by the client,
+# and a session cannot be revoked before it expires other than by rotating SECRET_KEY.
+# Expired db sessions are removed by `python manage.py clear_expired_sessions`.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = 'cached_db'
+SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Product page fragments and the catalogue generation counter, see shopapp.cache
+
+SHOP_CACHE = 'shop'
+SHOP_FRAGMENT_CACHE_TIMEOUT = 600
+# How long the admin changelists reuse an estimated table size, see shopapp.admin_mixins
+ADMIN_COUNT_CACHE_TIMEOUT = 300
+
+# Rate limiting, see requestdataapp.middlewares.RateLimitMiddleware
+# Limits are (max requests, period in seconds) per user or IP address
+
+RATE_LIMIT_DEFAULT = (55, 60)
+RATE_LIMITS = {
+    'requestdataapp:file-upload': (10, 60),
+    'requestdataapp:file-upload-form': (10, 60),
+}
+# How often each process deletes the counters of windows that have expired
+RATE_LIMIT_PURGE_INTERVAL = 60
+
+# Per-URL request timings, see requestdataapp.middlewares.RequestMetricsMiddleware
+
+REQUEST_METRICS_FLUSH_INTERVAL = 300
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'requestdataapp.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+# Authentication
+# Resolved permissions are cached per user, see myauth.backends and myauth.signals
+
+AUTHENTICATION_BACKENDS = ['myauth.backends.CachedModelBackend']
+PERMISSION_CACHE = 'permissions'
+PERMISSION_CACHE_TIMEOUT = 3600
+
+# Keeps the test run off the on-disk caches of the development site
+
+TEST_RUNNER = 'mysite.testing.IsolatedCachesTestRunner'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -119,6 +219,21 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Files written by the run_export_jobs command
+
+EXPORT_JOBS_ROOT = BASE_DIR / 'exports'
+# Seconds without progress after which a running export job is taken back into the queue,
+# as its worker has crashed or been killed
+EXPORT_JOB_STALE_TIMEOUT = 600
+
+# Largest file the requestdataapp upload views accept, in bytes
+
+UPLOAD_MAX_SIZE = 1048576
+
+# Content-addressed storage of the requestdataapp uploads
+
+UPLOADS_ROOT = BASE_DIR / 'uploads'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
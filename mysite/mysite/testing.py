@@ -0,0 +1,39 @@
+"""
+Tests and benchmarks run on throwaway databases. Writing what they compute into the
+site's on-disk caches would serve it to the real site: the cached permissions of a test
+user with pk=1 would become those of the real user with pk=1.
+"""
+import os
+from typing import Optional
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+FILE_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+
+
+def isolated_caches(directory: Optional[str] = None) -> dict:
+    """
+    CACHES with a cache of its own for every alias: a process-local LocMemCache, or with
+    `directory`, file caches keep their backend under it, so benchmark timings stay comparable
+    """
+    caches = {}
+    for alias, config in settings.CACHES.items():
+        if directory is not None and config['BACKEND'] == FILE_BACKEND:
+            caches[alias] = {**config, 'LOCATION': os.path.join(directory, alias)}
+        else:
+            caches[alias] = {'BACKEND': LOCMEM_BACKEND, 'LOCATION': f'isolated-{alias}'}
+    return caches
+
+
+class IsolatedCachesTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.caches_override = override_settings(CACHES = isolated_caches())
+        self.caches_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from django import forms
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import InMemoryUploadedFile
@@ -12,4 +14,10 @@ def validate_file_name(file:InMemoryUploadedFile)->None:
     if file.name and 'virus' in file.name:
         raise ValidationError('file  name should not contain "virus"')
 class UploadFileForm(forms.Form):
-    file=forms.FileField(validators=[validate_file_name])
\ No newline at end of file
+    file=forms.FileField(validators=[validate_file_name])
+
+    def __init__(self, *args, upload_error: Optional[ValidationError] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if upload_error is not None:
+            # the upload handler dropped the file, so the field reports it as missing
+            self.fields['file'].error_messages['required'] = upload_error.messages[0]
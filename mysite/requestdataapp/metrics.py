@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency buckets, in milliseconds
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram: recording is a bisect and two additions
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, value_ms: float) -> None:
+        self.buckets[bisect_left(BUCKET_BOUNDS_MS, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Upper bound of the bucket holding the given fraction of samples
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bound, bucket_count in zip(BUCKET_BOUNDS_MS, self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+class EndpointStats:
+    def __init__(self):
+        self.wall = Histogram()
+        self.queries = 0
+        self.db_ms = 0.0
+
+    def as_dict(self) -> dict:
+        count = self.wall.count
+        return {
+            'requests': count,
+            'avg_ms': round(self.wall.total_ms / count, 2),
+            'p50_ms': round(self.wall.percentile(0.5), 2),
+            'p95_ms': round(self.wall.percentile(0.95), 2),
+            'p99_ms': round(self.wall.percentile(0.99), 2),
+            'max_ms': round(self.wall.max_ms, 2),
+            'avg_queries': round(self.queries / count, 2),
+            'avg_db_ms': round(self.db_ms / count, 2),
+        }
+
+
+class MetricsRegistry:
+    """
+    Per-process request metrics grouped by URL name
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.endpoints: dict[str, EndpointStats] = {}
+        self.started_at = time.time()
+
+    def record(self, url_name: str, wall_ms: float, queries: int, db_ms: float) -> None:
+        with self.lock:
+            stats = self.endpoints.get(url_name)
+            if stats is None:
+                stats = self.endpoints[url_name] = EndpointStats()
+            stats.wall.record(wall_ms)
+            stats.queries += queries
+            stats.db_ms += db_ms
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'since': self.started_at,
+                'endpoints': {name: stats.as_dict() for name, stats in sorted(self.endpoints.items())},
+            }
+
+    def flush(self, interval: float) -> None:
+        """
+        Logs and resets the metrics once `interval` seconds have passed since the last flush
+        """
+        if time.time() - self.started_at < interval:
+            return
+        with self.lock:
+            if time.time() - self.started_at < interval:
+                return
+            endpoints = {name: stats.as_dict() for name, stats in sorted(self.endpoints.items())}
+            self.reset()
+        for name, stats in endpoints.items():
+            logger.info('%s %s', name, ' '.join(f'{key}={value}' for key, value in stats.items()))
+
+
+registry = MetricsRegistry()
+
+
+class QueryTimer:
+    """
+    connection.execute_wrapper() hook counting queries and their time
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration_ms += (time.perf_counter() - start) * 1000
+            self.queries += 1
@@ -1,25 +1,148 @@
-import datetime
+import math
+import time
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
 from django.http import HttpRequest, HttpResponse
 
+from .metrics import QueryTimer, registry
+from .models import RateLimitCounter
+
+
+class RateLimitMiddleware:
+    """
+    Sliding-window rate limiter shared by all worker processes.
+
+    Counters are RateLimitCounter rows, one per client and fixed window. The request
+    rate is estimated from the current window plus the previous one weighted by how
+    much of it still overlaps the sliding window. Every request costs one primary key
+    SELECT of both counters and one conditional upsert, which only counts the request
+    if the counter is still below the allowance left by the previous window, so the
+    limit holds under concurrent requests. Expired rows are purged every
+    RATE_LIMIT_PURGE_INTERVAL seconds per process, through the expires_at index.
+
+    Clients are authenticated users or, for anonymous requests, IP addresses.
+    Views listed in RATE_LIMITS by URL name get their own limit and counters,
+    every other view shares RATE_LIMIT_DEFAULT. A limit of None disables limiting.
+    Under ASGI Django runs process_view() in a worker thread, as the queries are synchronous.
+    """
+
+    sync_capable = True
+    async_capable = True
 
-class CountRequestMiddlewares:
     def __init__(self, get_response):
         self.get_response = get_response
-        self.request_count = 0
-        self.responses_count = 0
-        self.exceptions_count = 0
+        self.default_limit = settings.RATE_LIMIT_DEFAULT
+        self.limits = settings.RATE_LIMITS
+        self.next_purge = 0.0
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request: HttpRequest):
-        self.request_count += 1
-        if self.request_count == 1:
-            self.time_start = datetime.datetime.now()
-        if self.request_count == 55:
-            self.time_end = datetime.datetime.now()
-            print(self.time_start)
-            print(self.time_end)
-            if self.time_end - self.time_start <= datetime.timedelta(seconds=60):
-                return HttpResponse('Вы слишком часто обновляете страницу!')
-        response = self.get_response(request)
-        self.responses_count += 1
+        return self.get_response(request)
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        if view_name in self.limits:
+            scope, limit = view_name, self.limits[view_name]
+        else:
+            scope, limit = 'default', self.default_limit
+        if limit is None:
+            return None
+        retry_after = self.hit(f'{scope}:{self.get_client_id(request)}', *limit)
+        if retry_after:
+            response = HttpResponse('Вы слишком часто обновляете страницу!', status = 429)
+            response['Retry-After'] = str(retry_after)
+            return response
+        return None
+
+    @staticmethod
+    def get_client_id(request: HttpRequest) -> str:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+    def hit(self, client_key: str, max_requests: int, period: int) -> int:
+        """
+        Counts a request and returns 0, or the seconds to wait if the client is over the limit
+        """
+        now = time.time()
+        self.purge_expired(now)
+        window = int(now // period)
+        current_key = f'{client_key}:{window}'
+        previous_key = f'{client_key}:{window - 1}'
+        counts = dict(RateLimitCounter.objects.filter(key__in = [current_key, previous_key]).values_list('key', 'count'))
+        previous = counts.get(previous_key, 0)
+        elapsed = now - window * period
+        # the current window may hold fewer requests than this
+        allowance = max_requests - previous * (period - elapsed) / period
+        if allowance > 0 and RateLimitCounter.objects.increment_below(current_key, allowance, (window + 2) * period):
+            return 0
+        # the snapshot may lag behind concurrent requests, the upsert has just seen at least this many
+        current = max(counts.get(current_key, 0), math.ceil(allowance))
+        if current >= max_requests or not previous:
+            wait = period - elapsed
+        else:
+            # the previous window's share decays linearly until the estimate drops below the limit
+            wait = period - elapsed - (max_requests - current) * period / previous
+        return max(1, math.ceil(wait))
+
+    def purge_expired(self, now: float) -> None:
+        if now < self.next_purge:
+            return
+        self.next_purge = now + settings.RATE_LIMIT_PURGE_INTERVAL
+        RateLimitCounter.objects.filter(expires_at__lt = now).delete()
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures wall time, query count and query time of every request.
+
+    The numbers are added to the in-process registry under the resolved URL name,
+    sent back in a Server-Timing header and logged every REQUEST_METRICS_FLUSH_INTERVAL
+    seconds. The body of a streaming response is produced after the measurement ends.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.flush_interval = settings.REQUEST_METRICS_FLUSH_INTERVAL
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        return self.record(request, response, timer, start)
+
+    async def __acall__(self, request: HttpRequest):
+        # connections are per thread and the async ORM queries from the request's worker
+        # thread, so the timer is installed there rather than on the event loop's connection
+        timer = QueryTimer()
+        start = time.perf_counter()
+        await sync_to_async(lambda: connection.execute_wrappers.append(timer))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connection.execute_wrappers.remove(timer))()
+        return self.record(request, response, timer, start)
+
+    def record(self, request: HttpRequest, response: HttpResponse, timer: QueryTimer, start: float) -> HttpResponse:
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        url_name = match.view_name if match and match.view_name else '<unresolved>'
+        registry.record(url_name, wall_ms, timer.queries, timer.duration_ms)
+        response['Server-Timing'] = (
+            f'app;dur={wall_ms:.2f}, db;dur={timer.duration_ms:.2f};desc="{timer.queries} queries"'
+        )
+        registry.flush(self.flush_interval)
         return response
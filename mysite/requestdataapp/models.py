@@ -1,2 +1,76 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F
 
+
+class Blob(models.Model):
+    """
+    One distinct file content, stored once under its SHA-256 by ContentAddressedStorage.
+    `refcount` is the number of StoredFile names pointing at it.
+    """
+
+    sha256 = models.CharField(max_length = 64, unique = True)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length = 100, blank = True)
+    refcount = models.PositiveIntegerField(default = 0)
+    created_at = models.DateTimeField(auto_now_add = True)
+
+    def __str__(self) -> str:
+        return f'Blob (sha256={self.sha256!r}, refcount={self.refcount})'
+
+
+class StoredFile(models.Model):
+    """
+    A name in ContentAddressedStorage and the content it refers to
+    """
+
+    name = models.CharField(max_length = 255, unique = True)
+    blob = models.ForeignKey(Blob, on_delete = models.PROTECT, related_name = 'names')
+    created_at = models.DateTimeField(auto_now_add = True)
+
+    def __str__(self) -> str:
+        return f'StoredFile (name={self.name!r}, blob_id={self.blob_id})'
+
+
+class RateLimitCounterManager(models.Manager):
+    def increment_below(self, key: str, allowance: float, expires_at: float) -> bool:
+        """
+        Adds one to the counter if it is below `allowance`, creating it if needed, and tells
+        whether it did. A single statement on SQLite and PostgreSQL, so concurrent requests
+        from any number of processes can neither lose an increment nor all squeeze past the limit.
+        """
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            return self._increment_below_locked(key, allowance, expires_at)
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ("key", "count", "expires_at") VALUES (%s, 1, %s) '
+                f'ON CONFLICT ("key") DO UPDATE SET "count" = {table}."count" + 1 '
+                f'WHERE {table}."count" < %s '
+                f'RETURNING "count"',
+                [key, expires_at, allowance],
+            )
+            return cursor.fetchone() is not None
+
+    def _increment_below_locked(self, key: str, allowance: float, expires_at: float) -> bool:
+        with transaction.atomic():
+            counter, _ = self.select_for_update().get_or_create(key = key, defaults = {'expires_at': expires_at})
+            if counter.count >= allowance:
+                return False
+            self.filter(pk = key).update(count = F('count') + 1)
+            return True
+
+
+class RateLimitCounter(models.Model):
+    """
+    Requests of one client in one fixed window, see RateLimitMiddleware
+    """
+
+    key = models.CharField(max_length = 200, primary_key = True)
+    count = models.PositiveIntegerField(default = 0)
+    # seconds since the epoch, after which the window no longer counts
+    expires_at = models.FloatField(db_index = True)
+
+    objects = RateLimitCounterManager()
+
+    def __str__(self) -> str:
+        return f'RateLimitCounter (key={self.key!r}, count={self.count})'
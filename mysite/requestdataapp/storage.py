@@ -0,0 +1,147 @@
+import hashlib
+import os
+import tempfile
+from typing import IO, Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .models import Blob, StoredFile
+
+
+@deconstructible
+class ContentAddressedStorage(Storage):
+    """
+    Stores every distinct content once, as blobs/<ab>/<cd>/<abcd...> named by its SHA-256,
+    so no directory holds more than 256 entries. File names live in the StoredFile table
+    and point at blobs: saving content that is already there adds a name and a reference
+    instead of a file, and a blob is deleted along with its last name.
+
+    Writers that hash while receiving, like StreamingUploadHandler, use open_upload()
+    and finish_upload() so the content is written to disk only once.
+    """
+
+    def __init__(self, location: Optional[str] = None):
+        self.location = os.path.abspath(location or settings.UPLOADS_ROOT)
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.location, 'blobs', sha256[:2], sha256[2:4], sha256)
+
+    def open_upload(self) -> IO[bytes]:
+        """
+        A new file under the storage root to write content into before its hash is known.
+        On the same filesystem as the blobs, so finish_upload() only renames it.
+        """
+        incoming = os.path.join(self.location, 'incoming')
+        os.makedirs(incoming, exist_ok = True)
+        return tempfile.NamedTemporaryFile(dir = incoming, delete = False)
+
+    def abort_upload(self, upload: IO[bytes]) -> None:
+        upload.close()
+        os.remove(upload.name)
+
+    def finish_upload(self, name: str, upload: IO[bytes], sha256: str, size: int, content_type: str = '') -> str:
+        """
+        Files the written content under `name`, or under a free variant of it, and returns the name used
+        """
+        upload.close()
+        path = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        try:
+            with transaction.atomic():
+                # the row lock orders this against delete() of the last name of the same content
+                blob, _ = Blob.objects.select_for_update().get_or_create(
+                    sha256 = sha256,
+                    defaults = {'size': size, 'content_type': content_type},
+                )
+                name = self.add_name(name, blob)
+                Blob.objects.filter(pk = blob.pk).update(refcount = F('refcount') + 1)
+                if os.path.exists(path):
+                    os.remove(upload.name)
+                else:
+                    os.replace(upload.name, path)
+        except BaseException:
+            if os.path.exists(upload.name):
+                os.remove(upload.name)
+            raise
+        return name
+
+    def add_name(self, name: str, blob: Blob) -> str:
+        while True:
+            name = self.get_available_name(name)
+            try:
+                with transaction.atomic():
+                    StoredFile.objects.create(name = name, blob = blob)
+                return name
+            except IntegrityError:
+                # another request took the name in between
+                continue
+
+    def _save(self, name: str, content: File) -> str:
+        upload = self.open_upload()
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            for chunk in content.chunks():
+                sha256.update(chunk)
+                size += len(chunk)
+                upload.write(chunk)
+        except BaseException:
+            self.abort_upload(upload)
+            raise
+        return self.finish_upload(name, upload, sha256.hexdigest(), size, getattr(content, 'content_type', '') or '')
+
+    def _open(self, name: str, mode: str = 'rb') -> File:
+        if 'w' in mode or 'a' in mode or '+' in mode:
+            raise ValueError('Content-addressed files cannot be modified, save a new name instead')
+        return File(open(self.path(name), mode), name)
+
+    def delete(self, name: str) -> None:
+        with transaction.atomic():
+            stored = StoredFile.objects.filter(name = name).values_list('pk', 'blob_id').first()
+            if stored is None:
+                return
+            pk, blob_id = stored
+            blob = Blob.objects.select_for_update().get(pk = blob_id)
+            StoredFile.objects.filter(pk = pk).delete()
+            if blob.refcount > 1:
+                Blob.objects.filter(pk = blob.pk).update(refcount = F('refcount') - 1)
+                return
+            blob.delete()
+            # still holding the row lock, so an upload of the same content waits and writes it again
+            try:
+                os.remove(self.blob_path(blob.sha256))
+            except FileNotFoundError:
+                pass
+
+    def exists(self, name: str) -> bool:
+        return StoredFile.objects.filter(name = name).exists()
+
+    def path(self, name: str) -> str:
+        try:
+            sha256 = StoredFile.objects.values_list('blob__sha256', flat = True).get(name = name)
+        except StoredFile.DoesNotExist:
+            raise FileNotFoundError(name)
+        return self.blob_path(sha256)
+
+    def size(self, name: str) -> int:
+        try:
+            return StoredFile.objects.values_list('blob__size', flat = True).get(name = name)
+        except StoredFile.DoesNotExist:
+            raise FileNotFoundError(name)
+
+    def listdir(self, path: str) -> tuple[list, list]:
+        """
+        Names are flat, so there are no directories; files are the names under the `path/` prefix
+        """
+        prefix = path.rstrip('/') + '/' if path else ''
+        names = StoredFile.objects.filter(name__startswith = prefix).values_list('name', flat = True)
+        return [], [name[len(prefix):] for name in names]
+
+
+def get_upload_storage() -> ContentAddressedStorage:
+    return ContentAddressedStorage(location = settings.UPLOADS_ROOT)
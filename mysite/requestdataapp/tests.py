@@ -1 +1,186 @@
-# Create your tests here.
+import hashlib
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .metrics import registry
+from .models import Blob, RateLimitCounter, StoredFile
+from .storage import get_upload_storage
+from .uploads import sniff_content_type
+
+
+@override_settings(
+    RATE_LIMIT_DEFAULT = (3, 60),
+    RATE_LIMITS = {'requestdataapp:user-form': (1, 60), 'requestdataapp:get-view': None},
+)
+class RateLimitMiddlewareTestCase(TestCase):
+    def test_default_limit(self):
+        for _ in range(3):
+            response = self.client.get(reverse('myauth:foo-bar'))
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('myauth:foo-bar'))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    def test_per_url_limit(self):
+        self.assertEqual(self.client.get(reverse('requestdataapp:user-form')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('requestdataapp:user-form')).status_code, 429)
+        self.assertEqual(self.client.get(reverse('myauth:foo-bar')).status_code, 200)
+
+    def test_unlimited_url(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get(reverse('requestdataapp:get-view')).status_code, 200)
+
+    def test_clients_are_counted_separately(self):
+        self.client.get(reverse('requestdataapp:user-form'))
+        response = self.client.get(reverse('requestdataapp:user-form'), REMOTE_ADDR = '10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(User.objects.create_user(username = 'bob-test', password = '12345'))
+        self.assertEqual(self.client.get(reverse('requestdataapp:user-form')).status_code, 200)
+
+    def test_constant_queries_per_request(self):
+        self.client.get(reverse('myauth:foo-bar'))
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('myauth:foo-bar'))
+        queries = [query['sql'] for query in context.captured_queries if 'ratelimitcounter' in query['sql']]
+        self.assertEqual(len(queries), 2)
+
+    def test_increments_stop_at_the_allowance(self):
+        # what a request that read the counters before the others were counted would attempt
+        for _ in range(5):
+            RateLimitCounter.objects.increment_below('default:ip:10.0.0.9:1', 3, time.time() + 60)
+        self.assertEqual(RateLimitCounter.objects.get(key = 'default:ip:10.0.0.9:1').count, 3)
+
+    def test_expired_counters_are_purged(self):
+        RateLimitCounter.objects.create(key = 'default:ip:10.0.0.9:1', count = 3, expires_at = time.time() - 1)
+        self.client.get(reverse('myauth:foo-bar'))
+        self.assertFalse(RateLimitCounter.objects.filter(key = 'default:ip:10.0.0.9:1').exists())
+
+
+class RequestMetricsMiddlewareTestCase(TestCase):
+    def setUp(self) -> None:
+        registry.reset()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('myauth:foo-bar'))
+        self.assertIn('app;dur=', response['Server-Timing'])
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_metrics_view(self):
+        user = User.objects.create_user(username = 'bob-staff', password = '12345', is_staff = True)
+        self.client.force_login(user)
+        self.client.get(reverse('shopapp:products_list'))
+        self.client.get(reverse('shopapp:products_list'))
+        data = self.client.get(reverse('requestdataapp:metrics')).json()
+        stats = data['endpoints']['shopapp:products_list']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['avg_queries'], 0)
+
+    def test_metrics_view_is_staff_only(self):
+        response = self.client.get(reverse('requestdataapp:metrics'))
+        self.assertEqual(response.status_code, 302)
+
+
+class UploadsRootTestCase(TestCase):
+    def setUp(self) -> None:
+        uploads_root = tempfile.TemporaryDirectory()
+        self.addCleanup(uploads_root.cleanup)
+        self.uploads_root = uploads_root.name
+        settings = override_settings(UPLOADS_ROOT = self.uploads_root, UPLOAD_MAX_SIZE = 1000)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def files_on_disk(self) -> list:
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.uploads_root)
+            for root, _, names in os.walk(self.uploads_root)
+            for name in names
+        )
+
+    def stored_files(self) -> list:
+        return sorted(StoredFile.objects.values_list('name', flat = True))
+
+
+class StreamingUploadTestCase(UploadsRootTestCase):
+    PNG = b'\x89PNG\r\n\x1a\n' + bytes(100)
+
+    def test_upload_is_stored_hashed_and_sniffed(self):
+        upload = SimpleUploadedFile('picture.bin', self.PNG, content_type = 'text/plain')
+        response = self.client.post(reverse('requestdataapp:file-upload-form'), {'file': upload})
+        myfile = response.context['form'].cleaned_data['file']
+        self.assertEqual(myfile.sha256, hashlib.sha256(self.PNG).hexdigest())
+        self.assertEqual(myfile.content_type, 'image/png')
+        self.assertEqual(myfile.client_content_type, 'text/plain')
+        self.assertEqual(self.stored_files(), ['picture.bin'])
+        with get_upload_storage().open('picture.bin') as f:
+            self.assertEqual(f.read(), self.PNG)
+
+    def test_too_large_upload_is_rejected_and_not_stored(self):
+        upload = SimpleUploadedFile('big.txt', b'x' * 1001)
+        response = self.client.post(reverse('requestdataapp:file-upload'), {'myfile': upload})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(self.files_on_disk(), [])
+
+    def test_file_name_is_validated_before_storing(self):
+        upload = SimpleUploadedFile('virus.txt', b'hello')
+        response = self.client.post(reverse('requestdataapp:file-upload-form'), {'file': upload})
+        self.assertFormError(response.context['form'], 'file', 'file  name should not contain "virus"')
+        self.assertEqual(self.stored_files(), [])
+
+    def test_csrf_is_still_checked(self):
+        client = Client(enforce_csrf_checks = True)
+        upload = SimpleUploadedFile('note.txt', b'hello')
+        response = client.post(reverse('requestdataapp:file-upload'), {'myfile': upload})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(self.files_on_disk(), [])
+
+    def test_sniff_content_type(self):
+        self.assertEqual(sniff_content_type(b'%PDF-1.7'), 'application/pdf')
+        self.assertEqual(sniff_content_type('привет'.encode()[:-1]), 'text/plain')
+        self.assertEqual(sniff_content_type(b'\x00\x01'), 'application/octet-stream')
+
+
+class ContentAddressedStorageTestCase(UploadsRootTestCase):
+    def test_identical_content_is_stored_once(self):
+        storage = get_upload_storage()
+        first = storage.save('a.txt', ContentFile(b'same content'))
+        second = storage.save('a.txt', ContentFile(b'same content'))
+        storage.save('b.txt', ContentFile(b'other content'))
+        self.assertNotEqual(first, second)
+        sha256 = hashlib.sha256(b'same content').hexdigest()
+        self.assertEqual(storage.path(first), storage.path(second))
+        self.assertEqual(storage.path(first), os.path.join(self.uploads_root, 'blobs', sha256[:2], sha256[2:4], sha256))
+        self.assertEqual(Blob.objects.get(sha256 = sha256).refcount, 2)
+        self.assertEqual(len(self.files_on_disk()), 2)
+
+    def test_blob_is_deleted_with_its_last_name(self):
+        storage = get_upload_storage()
+        first = storage.save('a.txt', ContentFile(b'same content'))
+        second = storage.save('copy.txt', ContentFile(b'same content'))
+        storage.delete(first)
+        self.assertFalse(storage.exists(first))
+        self.assertEqual(Blob.objects.get().refcount, 1)
+        with storage.open(second) as f:
+            self.assertEqual(f.read(), b'same content')
+        storage.delete(second)
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.files_on_disk(), [])
+
+    def test_repeated_uploads_share_a_blob(self):
+        for _ in range(3):
+            upload = SimpleUploadedFile('note.txt', b'hello')
+            response = self.client.post(reverse('requestdataapp:file-upload'), {'myfile': upload})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.stored_files()), 3)
+        self.assertEqual(Blob.objects.get().refcount, 3)
+        self.assertEqual(len(self.files_on_disk()), 1)
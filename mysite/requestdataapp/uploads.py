@@ -0,0 +1,204 @@
+"""
+Upload handling for the requestdataapp file endpoints. StreamingUploadHandler
+writes each chunk straight into the content-addressed storage while hashing it,
+so the body is never spooled to memory or a temporary file first.
+"""
+import codecs
+import hashlib
+import logging
+from functools import wraps
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers, StopUpload
+from django.http import HttpRequest
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from .forms import validate_file_name
+from .storage import ContentAddressedStorage, get_upload_storage
+
+logger = logging.getLogger(__name__)
+
+# Bytes from the start of the file that sniff_content_type() looks at
+SNIFF_SIZE = 512
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'\x1f\x8b', 'application/gzip'),
+)
+
+
+def sniff_content_type(head: bytes) -> str:
+    """
+    MIME type from the leading bytes of a file, ignoring what the client declared
+    """
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head and b'\x00' not in head:
+        try:
+            # the head may end in the middle of a character
+            codecs.getincrementaldecoder('utf-8')().decode(head, final = False)
+            return 'text/plain'
+        except UnicodeDecodeError:
+            pass
+    return 'application/octet-stream'
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    A file the upload handler has already written to the storage, under `stored_name`
+    """
+
+    def __init__(self, file, name, stored_name, size, content_type, client_content_type, sha256, storage):
+        super().__init__(file, name, content_type, size)
+        self.stored_name = stored_name
+        self.client_content_type = client_content_type
+        self.sha256 = sha256
+        self.storage = storage
+
+    def delete(self) -> None:
+        self.close()
+        self.storage.delete(self.stored_name)
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Stores the files of `field_names` (all fields if empty) in a ContentAddressedStorage,
+    written once and renamed into place by their hash.
+    A file name that fails validate_file_name() is rejected before anything is written,
+    a file is rejected as soon as it grows past `max_size`. Rejections stop the upload,
+    delete the files already stored and leave the reason in `error`.
+    """
+
+    def __init__(self,
+                 request: Optional[HttpRequest] = None,
+                 field_names: tuple = (),
+                 max_size: Optional[int] = None,
+                 storage: Optional[ContentAddressedStorage] = None):
+        super().__init__(request)
+        self.field_names = field_names
+        self.max_size = settings.UPLOAD_MAX_SIZE if max_size is None else max_size
+        self.storage = storage or get_upload_storage()
+        self.error = None
+        # not `file`: MultiPartParser closes handler.file on StopUpload, and it is None between files
+        self.destination = None
+        self.completed = []
+        # set once the CSRF check of streaming_upload() has passed
+        self.checked = False
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset = None, content_type_extra = None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if self.field_names and field_name not in self.field_names:
+            raise SkipFile()
+        try:
+            validate_file_name(UploadedFile(name = file_name))
+        except ValidationError as e:
+            self.reject(e)
+        if content_length is not None and content_length > self.max_size:
+            self.reject(self.too_large())
+        self.destination = self.storage.open_upload()
+        self.size = 0
+        self.head = b''
+        self.sha256 = hashlib.sha256()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self.discard()
+            self.reject(self.too_large())
+        if len(self.head) < SNIFF_SIZE:
+            self.head += raw_data[:SNIFF_SIZE - len(self.head)]
+        self.sha256.update(raw_data)
+        self.destination.write(raw_data)
+
+    def file_complete(self, file_size):
+        upload, self.destination = self.destination, None
+        content_type = sniff_content_type(self.head)
+        sha256 = self.sha256.hexdigest()
+        stored_name = self.storage.finish_upload(self.file_name, upload, sha256, self.size, content_type)
+        logger.info('stored upload %s, %d bytes, sha256 %s', stored_name, self.size, sha256)
+        uploaded = StoredUploadedFile(
+            file = open(self.storage.blob_path(sha256), 'rb'),
+            name = self.file_name,
+            stored_name = stored_name,
+            size = self.size,
+            content_type = content_type,
+            client_content_type = self.content_type,
+            sha256 = sha256,
+            storage = self.storage,
+        )
+        self.completed.append(uploaded)
+        return uploaded
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def discard(self) -> None:
+        if self.destination is not None:
+            self.storage.abort_upload(self.destination)
+            self.destination = None
+
+    def reject(self, error: ValidationError):
+        self.error = error
+        self.discard_completed()
+        # the rest of the body is read and dropped, so the view can still answer with the reason
+        raise StopUpload(connection_reset = False)
+
+    def discard_completed(self) -> None:
+        """
+        Deletes the files of this request that were already stored: a rejected request keeps none
+        """
+        for uploaded in self.completed:
+            uploaded.delete()
+        self.completed = []
+
+    def too_large(self) -> ValidationError:
+        return ValidationError(f'The file is larger than {filesizeformat(self.max_size)}.', code = 'too_large')
+
+
+def streaming_upload(*field_names: str, max_size: Optional[int] = None) -> Callable:
+    """
+    Makes the view store uploads with StreamingUploadHandler.
+    CsrfViewMiddleware reads request.POST before the view runs, which would parse the
+    body with the default handlers, so the check is moved inside, after the swap.
+    """
+
+    def decorator(view: Callable) -> Callable:
+        @csrf_protect
+        def checked(request: HttpRequest, *args, **kwargs):
+            request.upload_handlers[0].checked = True
+            return view(request, *args, **kwargs)
+
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs):
+            handler = StreamingUploadHandler(request, field_names, max_size)
+            request.upload_handlers = [handler]
+            response = checked(request, *args, **kwargs)
+            if not handler.checked:
+                # the CSRF check parses the body, so a forged request has stored its files by now
+                handler.discard_completed()
+            return response
+
+        return csrf_exempt(wrapper)
+
+    return decorator
+
+
+def upload_error(request: HttpRequest) -> Optional[ValidationError]:
+    """
+    Why StreamingUploadHandler rejected the upload of this request, if it did
+    """
+    request.FILES  # parses the body
+    for handler in request.upload_handlers:
+        if getattr(handler, 'error', None) is not None:
+            return handler.error
+    return None
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import process_get_view, file_download, user_form, handle_file_upload
+from .views import process_get_view, file_download, user_form, handle_file_upload, metrics_view
 
 app_name = 'requestdataapp'
 
@@ -9,4 +9,5 @@ urlpatterns = [
     path('file/', file_download, name='file-upload'),
     path("bio/", user_form, name="user-form"),
     path("upload/", handle_file_upload, name="file-upload-form"),
+    path("metrics/", metrics_view, name="metrics"),
 ]
@@ -1,8 +1,14 @@
-from django.core.files.storage import FileSystemStorage
-from django.http import HttpRequest, HttpResponse
+import logging
+
+from django.contrib.auth.decorators import user_passes_test
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render
 
 from .forms import UserBioForm, UploadFileForm
+from .metrics import registry
+from .uploads import streaming_upload, upload_error
+
+logger = logging.getLogger(__name__)
 
 
 def process_get_view(request: HttpRequest) -> HttpResponse:
@@ -24,15 +30,14 @@ def user_form(request: HttpRequest) -> HttpResponse:
     return render(request, "requestdataapp/user-bio-form.html", context=context)
 
 
+@streaming_upload('file')
 def handle_file_upload(request: HttpRequest) -> HttpResponse:
     if request.method == "POST":
-        form = UploadFileForm(request.POST, request.FILES)
+        form = UploadFileForm(request.POST, request.FILES, upload_error = upload_error(request))
         if form.is_valid():
-            # myfile = request.FILES["myfile"]
-            myfile=form.cleaned_data['file']
-            fs = FileSystemStorage()
-            filename = fs.save(myfile.name, myfile)
-            print("saved file", filename)
+            # StreamingUploadHandler has already stored it
+            myfile = form.cleaned_data['file']
+            logger.info('uploaded %s as %s, sha256 %s', myfile.name, myfile.stored_name, myfile.sha256)
     else:
         form = UploadFileForm
     context = {
@@ -42,14 +47,19 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
     return render(request, "requestdataapp/file-upload-form.html", context=context)
 
 
+@streaming_upload('myfile')
 def file_download(request: HttpRequest) -> HttpResponse:
-    if request.method == 'POST' and request.FILES.get('myfile'):
-        max_size = 1048576
-        myfile = request.FILES['myfile']
-        fs = FileSystemStorage()
-        if myfile.size <= max_size:
-            filename = fs.save(myfile.name, myfile)
-            return render(request, 'requestdataapp/file-upload.html')
-        else:
-            return HttpResponse("Размер файла слишком велик.")
+    if request.method == 'POST':
+        error = upload_error(request)
+        if error is not None:
+            return HttpResponse(error.messages[0], status = 413 if error.code == 'too_large' else 400)
+        myfile = request.FILES.get('myfile')
+        if myfile:
+            logger.info('uploaded %s as %s, sha256 %s', myfile.name, myfile.stored_name, myfile.sha256)
+            return render(request, 'requestdataapp/file-upload.html', context = {'myfile': myfile})
     return render(request, 'requestdataapp/file-upload.html')
+
+
+@user_passes_test(lambda user: user.is_staff)
+def metrics_view(request: HttpRequest) -> JsonResponse:
+    return JsonResponse(registry.snapshot())
@@ -1,28 +1,46 @@
 from django.contrib import admin
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
+from django.db.models.functions import Length, Substr
 from django.http import HttpRequest
 
-from .admin_mixins import ExportAsCSVMixin
-from .models import Product, Order
+from .admin_mixins import ExportAsCSVMixin, FastChangeListMixin, PaginatedInlineMixin
+from .models import Product, Order, ExportJob
+from .search import indexed_prefix, search_products
 
 
-class OrderInline(admin.TabularInline):
+def changed_related_pks(formsets, field: str) -> set:
+    """
+    Old and new values of a foreign key in the inline forms that were changed or deleted
+    """
+    pks = set()
+    for formset in formsets:
+        for form in formset.forms:
+            if form.has_changed():
+                pks.add(form.initial.get(field))
+                pks.add(getattr(form.instance, f'{field}_id', None))
+    pks.discard(None)
+    return pks
+
+
+class OrderInline(PaginatedInlineMixin, admin.TabularInline):
     model = Product.orders.through
+    autocomplete_fields = 'order',
 
 
 @admin.action(description='Archived products')
 def mark_archieved(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archieved=True)
+    queryset.archive()
 
 
 @admin.action(description='Unarchieved products')
 def mark_unarchieved(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
-    queryset.update(archieved=False)
+    queryset.unarchive()
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
-    actions = [mark_archieved, mark_unarchieved, 'export_csv']
+class ProductAdmin(FastChangeListMixin, admin.ModelAdmin, ExportAsCSVMixin):
+    actions = [mark_archieved, mark_unarchieved, 'export_csv', 'export_csv_background']
+    export_job_kind = ExportJob.KIND_PRODUCTS
     inlines = [OrderInline]
     # list_display = 'pk', 'name', 'description', 'price', 'discount', 'created_at', 'archieved'
     list_display = 'pk', 'name', 'description_short', 'price', 'discount', 'created_at', 'archieved'
@@ -44,25 +62,81 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
         })
     ]
 
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        queryset = super().get_queryset(request)
+        if self.is_changelist_request(request):
+            # the list shows 50 characters, so the full descriptions stay in the database
+            queryset = queryset.defer('description').annotate(
+                description_start = Substr('description', 1, 50),
+                description_length = Length('description'),
+            )
+        return queryset
+
+    def get_search_results(self, request: HttpRequest, queryset: QuerySet, search_term: str):
+        # the search index instead of an icontains scan per keystroke; the changelist ordering applies
+        if not search_term.strip():
+            return queryset, False
+        return search_products(queryset, search_term, ranked = False), False
+
+    def save_related(self, request: HttpRequest, form, formsets, change: bool) -> None:
+        super().save_related(request, form, formsets, change)
+        # the inline saves the orders-products rows directly, which skips the m2m_changed signal
+        order_pks = changed_related_pks(formsets, 'order')
+        if order_pks:
+            Order.objects.filter(pk__in = order_pks).update_totals()
+
     def description_short(self, obj: Product) -> str:
-        if len(obj.description) < 50:
-            return obj.description
-        return obj.description[:50] + '...'
+        if obj.description_length < 50:
+            return obj.description_start
+        return obj.description_start + '...'
 
 
 # class ProductInline(admin.TabularInline):
-class ProductInline(admin.StackedInline):
+class ProductInline(PaginatedInlineMixin, admin.StackedInline):
     model = Order.products.through
+    autocomplete_fields = 'product',
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(FastChangeListMixin, admin.ModelAdmin, ExportAsCSVMixin):
+    actions = ['export_csv', 'export_csv_background']
+    export_job_kind = ExportJob.KIND_ORDERS
     inlines = [ProductInline]
     list_display = 'delivery_address', 'promocode', 'created_at', 'user_verbose'
     list_display_links = 'delivery_address', 'promocode'
+    ordering = '-pk',
+    # products are edited in the paginated inline, a select of them would list every product of the order
+    exclude = 'products',
+    readonly_fields = 'items_count', 'total_price'
+    autocomplete_fields = 'user',
+    search_fields = '=id', 'user__username'
 
     def get_queryset(self, request):
-        return Order.objects.select_related('user').prefetch_related('products')
+        # from super() so the ordering above reaches the changelist and the autocomplete too
+        # no products: the form excludes them and the paginated inline loads one page
+        return super().get_queryset(request).select_related('user')
+
+    def get_search_results(self, request: HttpRequest, queryset: QuerySet, search_term: str):
+        # an order number or the start of a username, both answered by an index
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = indexed_prefix('user__username', search_term)
+        if search_term.isdigit():
+            condition |= Q(pk = int(search_term))
+        return queryset.filter(condition), False
+
+    def save_related(self, request: HttpRequest, form, formsets, change: bool) -> None:
+        super().save_related(request, form, formsets, change)
+        Order.objects.filter(pk = form.instance.pk).update_totals()
 
     def user_verbose(self, obj: Order) -> str:
         return obj.user.username or obj.user.first_name
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = 'pk', 'kind', 'format', 'status', 'rows_written', 'created_by', 'created_at', 'finished_at'
+    list_filter = 'status', 'kind'
+    readonly_fields = 'rows_written', 'file_name', 'error', 'created_at', 'started_at', 'finished_at'
+    raw_id_fields = 'created_by',
@@ -1,20 +1,166 @@
 import csv
+from itertools import chain
 
-from django.db.models import QuerySet
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Model, QuerySet
 from django.db.models.options import Options
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, QueryDict, StreamingHttpResponse
+from django.urls import resolve, reverse
+from django.utils.functional import cached_property
+
+from .cache import get_shop_cache
+from .models import ExportJob
+
+CSV_EXPORT_CHUNK_SIZE = 2000
+# below this many rows COUNT(*) is cheap, and an exact count keeps small tables exact
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def estimated_row_count(model: type[Model]) -> int:
+    """
+    Approximate number of rows of the model's table, cached for ADMIN_COUNT_CACHE_TIMEOUT.
+    PostgreSQL keeps an estimate in its statistics, other databases pay for one COUNT(*)
+    per timeout.
+    """
+    table = model._meta.db_table
+    cache = get_shop_cache()
+    key = f'shopapp:row-count:{table}'
+    count = cache.get(key)
+    if count is not None:
+        return count
+    count = -1
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            count = row[0] if row else -1
+    if count < 0:
+        # never analyzed, or no statistics to read
+        count = model._default_manager.count()
+    cache.set(key, count, timeout = settings.ADMIN_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Takes the size of unfiltered changelists of big tables from estimated_row_count()
+    instead of a COUNT(*) on every page load. Filtered lists are still counted exactly.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        if isinstance(self.object_list, QuerySet) and not self.object_list.query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class PaginatedInlineMixin:
+    """
+    Inline that edits the related rows one page at a time, picked by ?<prefix>-page=<n>,
+    so a change page with thousands of related rows renders only `per_page` forms
+    """
+
+    per_page = 50
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.base_template = self.template
+        self.template = 'admin/shopapp/paginated_inline.html'
+
+    def get_formset(self, request: HttpRequest, obj = None, **kwargs):
+        formset_class = super().get_formset(request, obj, **kwargs)
+        per_page = self.per_page
+
+        class PaginatedFormSet(formset_class):
+            def get_queryset(self):
+                if not hasattr(self, 'page'):
+                    self.page_param = f'{self.prefix}-page'
+                    paginator = Paginator(super().get_queryset(), per_page)
+                    self.page = paginator.get_page(request.GET.get(self.page_param))
+                return self.page.object_list
+
+        return PaginatedFormSet
+
+
+class FastChangeListMixin:
+    """
+    Changelist settings for big tables: estimated counts and no second, unfiltered COUNT(*)
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def is_changelist_request(self, request: HttpRequest) -> bool:
+        meta: Options = self.model._meta
+        match = request.resolver_match
+        return match is not None and match.url_name == f'{meta.app_label}_{meta.model_name}_changelist'
+
+
+def changelist_queryset(model: type[Model], query_string: str, user: User) -> QuerySet:
+    """
+    The rows the admin changelist of the model shows `user` with this query string,
+    filters and search included, for work done outside the request
+    """
+    model_admin = admin.site._registry[model]
+    meta: Options = model._meta
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = reverse(f'admin:{meta.app_label}_{meta.model_name}_changelist')
+    request.GET = QueryDict(query_string)
+    request.user = user
+    request.resolver_match = resolve(request.path)
+    return model_admin.get_changelist_instance(request).get_queryset(request)
+
+
+class Echo:
+    """
+    File-like object for csv.writer: write() hands the line back instead of buffering it
+    """
+
+    def write(self, value: str) -> str:
+        return value
 
 
 class ExportAsCSVMixin:
-    def export_csv(self, request: HttpRequest, queryset=QuerySet):
+    export_job_kind = None
+
+    def export_csv(self, request: HttpRequest, queryset: QuerySet):
         meta: Options = self.model._meta
-        field_names = [field.name for field in meta.fields]
-        response = HttpResponse('text/csv')
+        fields = meta.fields
+        header = [field.name for field in fields]
+        rows = (
+            queryset
+            .values_list(*(field.attname for field in fields))
+            .iterator(chunk_size = CSV_EXPORT_CHUNK_SIZE)
+        )
+        csv_writer = csv.writer(Echo())
+        response = StreamingHttpResponse(
+            (csv_writer.writerow(row) for row in chain([header], rows)),
+            content_type = 'text/csv'
+        )
         response['Content-Disposition'] = f'attachment;filename={meta}-export.csv'
-        csv_writer = csv.writer(response)
-        csv_writer.writerow(field_names)
-        for obj in queryset:
-            csv_writer.writerow([getattr(obj, field) for field in field_names])
         return response
 
     export_csv.short_description = 'Export as CSV'
+
+    def export_csv_background(self, request: HttpRequest, queryset: QuerySet):
+        # "select all" can cover the whole table, so only its filters and search are stored
+        # and the worker reads the rows with changelist_queryset()
+        select_across = request.POST.get('select_across') == '1'
+        job = ExportJob.objects.create(
+            kind = self.export_job_kind,
+            format = ExportJob.FORMAT_CSV,
+            pks = None if select_across else list(queryset.values_list('pk', flat = True)),
+            changelist_query = request.GET.urlencode() if select_across else None,
+            created_by = request.user,
+        )
+        status_url = reverse('shopapp:export_job', kwargs = {'pk': job.pk})
+        self.message_user(request, f'Export job #{job.pk} queued, progress: {status_url}')
+
+    export_csv_background.short_description = 'Export as CSV in background'
@@ -0,0 +1,115 @@
+"""
+Async counterparts of the shop read views. They query the database with the async
+ORM, so under ASGI a request only hops to a worker thread for the queries themselves
+and for rendering templates, whose context processors may still query synchronously.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpRequest, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import render
+from django.views import View
+
+from .cache import get_catalogue_generation
+from .exporters import (ExportParamsError,
+                        achunked,
+                        aorder_export_rows,
+                        aproduct_export_chunks,
+                        astream_json_list,
+                        get_export_params,
+                        )
+from .models import Product
+from .pagination import KeysetPaginationMixin
+from .views import product_permissions
+
+
+async def aget_user(request: HttpRequest) -> User | AnonymousUser:
+    """
+    request.user loads the session and the user on first access, which the event loop must not do
+    """
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+async def arender(request: HttpRequest, template_name: str, context: dict) -> HttpResponse:
+    return await sync_to_async(render)(request, template_name, context)
+
+
+class AsyncProductsListView(KeysetPaginationMixin, View):
+    """
+    ProductsListView with keyset pages only: ?after=<pk> instead of page numbers
+    """
+
+    template_name = 'shopapp/products_list.html'
+    keyset_ordering = ('name', 'pk')
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        user = await aget_user(request)
+        page_size = self.get_paginate_by(None)
+        products = await self.akeyset_page(Product.active.all(), page_size)
+        context = {
+            'products': products,
+            'page_obj': None,
+            'page_size': page_size,
+            'next_after': self.next_after,
+            'catalogue_generation': await sync_to_async(get_catalogue_generation)(),
+            'can_view_product': user.is_superuser or await sync_to_async(user.has_perm)('shopapp.view_product'),
+            'fragment_cache_timeout': settings.SHOP_FRAGMENT_CACHE_TIMEOUT,
+        }
+        return await arender(request, self.template_name, context)
+
+
+class AsyncProductDetailsView(View):
+    template_name = 'shopapp/product-details.html'
+
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        try:
+            product = await Product.objects.aget(pk = pk)
+        except Product.DoesNotExist:
+            raise Http404('No product found')
+        user = await aget_user(request)
+        context = {
+            'product': product,
+            'fragment_cache_timeout': settings.SHOP_FRAGMENT_CACHE_TIMEOUT,
+            **await sync_to_async(product_permissions)(user, product),
+        }
+        return await arender(request, self.template_name, context)
+
+
+class AsyncProductsExportDataView(View):
+    """
+    ProductsExportDataView streamed from an async iterator
+    """
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        try:
+            after, limit = get_export_params(request)
+        except ExportParamsError as e:
+            return HttpResponseBadRequest(str(e))
+        return StreamingHttpResponse(
+            astream_json_list('products', aproduct_export_chunks(after = after, limit = limit)),
+            content_type = 'application/json'
+        )
+
+
+class AsyncOrdersExportDataView(View):
+    """
+    OrdersExportDataView streamed from an async iterator, staff only as well
+    """
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if not user.is_staff:
+            raise PermissionDenied
+        try:
+            after, limit = get_export_params(request)
+        except ExportParamsError as e:
+            return HttpResponseBadRequest(str(e))
+        return StreamingHttpResponse(
+            astream_json_list('orders', achunked(aorder_export_rows(after = after, limit = limit))),
+            content_type = 'application/json'
+        )
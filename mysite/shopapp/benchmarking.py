@@ -0,0 +1,172 @@
+import asyncio
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Order
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(request: Callable[[], object], repeat: int) -> dict:
+    """
+    Times `repeat` calls, then runs one more under tracemalloc for the peak memory
+    """
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = len(context.captured_queries)
+    tracemalloc.start()
+    try:
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'max_ms': round(max(timings), 2),
+        'queries': queries,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def get_body(client: Client, url: str) -> bytes:
+    response = client.get(url)
+    assert response.status_code == 200, f'{url} returned {response.status_code}'
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+def benchmark_endpoints(repeat: int) -> dict:
+    admin = User.objects.create_superuser(username = 'bench-admin', password = '!')
+    client = Client()
+    client.force_login(admin)
+    order_pk = Order.objects.order_by('pk').values_list('pk', flat = True).first()
+    urls = {
+        'products_list': reverse('shopapp:products_list'),
+        'orders_list': reverse('shopapp:orders_list'),
+        'products-export': reverse('shopapp:products-export'),
+        'orders-export': reverse('shopapp:orders-export'),
+        'admin_product_changelist': reverse('admin:shopapp_product_changelist'),
+        'admin_order_changelist': reverse('admin:shopapp_order_changelist'),
+    }
+    if order_pk is not None:
+        urls['order_details'] = reverse('shopapp:order_details', kwargs = {'pk': order_pk})
+    return {
+        name: dict(measure(lambda: get_body(client, url), repeat), url = url)
+        for name, url in urls.items()
+    }
+
+
+async def fetch(host: str, port: int, path: str, cookie: str) -> tuple[int, float]:
+    """
+    One GET over a new connection, read to the end. Returns (status, milliseconds).
+    """
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n'
+        if cookie:
+            request += f'Cookie: {cookie}\r\n'
+        writer.write((request + '\r\n').encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        while await reader.read(65536):
+            pass
+    finally:
+        writer.close()
+    status = int(status_line.split()[1]) if status_line else 0
+    return status, (time.perf_counter() - start) * 1000
+
+
+async def load_test(host: str,
+                    port: int,
+                    path: str,
+                    requests: int,
+                    concurrency: int,
+                    cookie: str = '') -> dict:
+    """
+    Sends `requests` GETs from `concurrency` clients at once, each starting
+    the next request as soon as the previous one has been read
+    """
+    timings = []
+    errors = 0
+    remaining = requests
+
+    async def client():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            try:
+                status, elapsed = await fetch(host, port, path, cookie)
+            except OSError:
+                status, elapsed = 0, 0
+            if status == 200:
+                timings.append(elapsed)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    report = {'requests': requests, 'errors': errors, 'rps': round(len(timings) / seconds, 1)}
+    if timings:
+        report.update({
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'max_ms': round(max(timings), 2),
+        })
+    return report
+
+
+async def wait_for_port(host: str, port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Nothing is listening on {host}:{port}')
+            await asyncio.sleep(0.1)
+        else:
+            writer.close()
+            return
+
+
+def server_urls(product_pk: Optional[int]) -> dict[str, tuple[str, str]]:
+    """
+    (sync url, async url) of the views that have an async counterpart
+    """
+    urls = {
+        'products_list': (reverse('shopapp:products_list'), reverse('shopapp:async_products_list')),
+        'products_export': (
+            reverse('shopapp:products-export') + '?limit=2000',
+            reverse('shopapp:async_products_export') + '?limit=2000',
+        ),
+        'orders_export': (
+            reverse('shopapp:orders-export') + '?limit=2000',
+            reverse('shopapp:async_orders_export') + '?limit=2000',
+        ),
+    }
+    if product_pk is not None:
+        urls['product_details'] = (
+            reverse('shopapp:product_details', kwargs = {'pk': product_pk}),
+            reverse('shopapp:async_product_details', kwargs = {'pk': product_pk}),
+        )
+    return urls
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CATALOGUE_GENERATION_KEY = 'shopapp:catalogue-generation'
+
+
+def get_shop_cache():
+    return caches[settings.SHOP_CACHE]
+
+
+def get_catalogue_generation() -> int:
+    """
+    Number that changes whenever any product changes. It is part of the key
+    of every cached catalogue page, so bumping it retires them all at once.
+    It comes from the clock rather than a counter: if the cache culls the key,
+    the next value must not be one that old pages are still stored under.
+    """
+    return get_shop_cache().get_or_set(CATALOGUE_GENERATION_KEY, time.time_ns, timeout = None)
+
+
+def bump_catalogue_generation() -> None:
+    """
+    Retires the cached pages once the current transaction commits. Bumping before that
+    would let a request in between cache the old rows under the new generation.
+    """
+    transaction.on_commit(
+        lambda: get_shop_cache().set(CATALOGUE_GENERATION_KEY, time.time_ns(), timeout = None)
+    )
@@ -0,0 +1,48 @@
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from myauth.permissions import get_permission_versions
+
+
+class ConditionalGetMixin:
+    """
+    Answers GET and HEAD with 304 Not Modified while the client's copy is still current.
+
+    get_validators() returns the last modification time and a few values that change
+    whenever the page content does, e.g. Max('updated_at') and a count. They are checked
+    before the view builds its response, so a 304 costs only that query. The ETag also
+    covers the URL, the user and the versions of the user's cached permissions, as pages
+    differ per user and show links by permission. Put the mixin after the access-checking
+    mixins so their checks run first.
+    """
+
+    def get_validators(self) -> Optional[tuple[Optional[datetime], list]]:
+        """
+        Returns (last_modified, etag_parts), or None to serve the request unconditionally
+        """
+        raise NotImplementedError
+
+    def dispatch(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        validators = self.get_validators() if request.method in ('GET', 'HEAD') else None
+        if validators is None:
+            return super().dispatch(request, *args, **kwargs)
+        last_modified, parts = validators
+        user_pk = request.user.pk
+        permissions = get_permission_versions(user_pk) if user_pk is not None else None
+        parts = [request.get_full_path(), user_pk, permissions, last_modified, *parts]
+        etag = quote_etag(hashlib.md5(repr(parts).encode(), usedforsecurity = False).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag = etag, last_modified = timestamp)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
@@ -0,0 +1,161 @@
+import csv
+import datetime
+import os
+from typing import Iterable, Iterator, Optional, TextIO
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model, Q
+from django.utils import timezone
+
+from .admin_mixins import changelist_queryset
+from .exporters import (EXPORT_CHUNK_SIZE,
+                        chunked,
+                        order_export_rows,
+                        product_export_chunks,
+                        stream_json_list,
+                        )
+from .models import ExportJob, Product, Order
+
+JOB_MODELS: dict[str, type[Model]] = {
+    ExportJob.KIND_PRODUCTS: Product,
+    ExportJob.KIND_ORDERS: Order,
+}
+
+
+def get_export_storage() -> FileSystemStorage:
+    return FileSystemStorage(location = settings.EXPORT_JOBS_ROOT)
+
+
+def requeue_stale_jobs() -> int:
+    """
+    Puts running jobs that have shown no progress for EXPORT_JOB_STALE_TIMEOUT back in the queue
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds = settings.EXPORT_JOB_STALE_TIMEOUT)
+    return ExportJob.objects.filter(
+        Q(heartbeat_at__lt = cutoff) | Q(heartbeat_at__isnull = True, started_at__lt = cutoff),
+        status = ExportJob.STATUS_RUNNING,
+    ).update(
+        status = ExportJob.STATUS_PENDING,
+        started_at = None,
+        heartbeat_at = None,
+        rows_written = 0,
+    )
+
+
+def claim_next_job() -> Optional[ExportJob]:
+    """
+    Takes the oldest pending job, after requeueing the abandoned ones. The status check
+    in the UPDATE makes sure two workers polling the same table never run the same job.
+    """
+    requeue_stale_jobs()
+    pending = ExportJob.objects.filter(status = ExportJob.STATUS_PENDING).order_by('pk')
+    for pk in pending.values_list('pk', flat = True)[:10]:
+        now = timezone.now()
+        claimed = ExportJob.objects.filter(pk = pk, status = ExportJob.STATUS_PENDING).update(
+            status = ExportJob.STATUS_RUNNING,
+            started_at = now,
+            heartbeat_at = now,
+        )
+        if claimed:
+            return ExportJob.objects.get(pk = pk)
+    return None
+
+
+def changelist_pk_chunks(job: ExportJob) -> Iterator[list]:
+    """
+    pks of the admin changelist the job was queued from, one keyset query per chunk
+    """
+    queryset = changelist_queryset(JOB_MODELS[job.kind], job.changelist_query, job.created_by)
+    last_pk = 0
+    while pks := list(
+        queryset.filter(pk__gt = last_pk).order_by('pk').values_list('pk', flat = True)[:EXPORT_CHUNK_SIZE]
+    ):
+        yield pks
+        last_pk = pks[-1]
+
+
+def job_chunks(job: ExportJob) -> Iterator[list]:
+    """
+    Rows of the job in pk order. The selection, a pks list or the changelist of an admin
+    "select all", is read in slices of EXPORT_CHUNK_SIZE pks, so no query carries more
+    parameters than that.
+    """
+    if job.changelist_query is not None:
+        selections = changelist_pk_chunks(job)
+    elif job.pks is None:
+        selections = [None]
+    else:
+        selections = chunked(sorted(job.pks), EXPORT_CHUNK_SIZE)
+    if job.format == ExportJob.FORMAT_CSV:
+        model = JOB_MODELS[job.kind]
+        fields = model._meta.fields
+        yield [[field.name for field in fields]]
+        for pks in selections:
+            if pks is not None:
+                queryset = model.objects.filter(pk__in = pks)
+            elif model is Product:
+                queryset = Product.active.all()
+            else:
+                queryset = model.objects.all()
+            rows = queryset.order_by('pk').values_list(*(field.attname for field in fields))
+            yield from chunked(rows.iterator(chunk_size = EXPORT_CHUNK_SIZE))
+    elif job.kind == ExportJob.KIND_PRODUCTS:
+        for pks in selections:
+            yield from product_export_chunks(pks = pks)
+    else:
+        for pks in selections:
+            yield from chunked(order_export_rows(pks = pks))
+
+
+def write_chunks(job: ExportJob, chunks: Iterable[list], file: TextIO) -> None:
+    """
+    Writes the chunks in the job's format and records progress after every chunk
+    """
+    if job.format == ExportJob.FORMAT_JSON:
+        chunks = _count_rows(job, chunks)
+        for part in stream_json_list(job.kind, chunks):
+            file.write(part)
+        return
+    csv_writer = csv.writer(file)
+    if job.format == ExportJob.FORMAT_CSV:
+        chunks = iter(chunks)
+        csv_writer.writerows(next(chunks))
+    encoder = DjangoJSONEncoder()
+    for chunk in _count_rows(job, chunks):
+        if job.format == ExportJob.FORMAT_CSV:
+            csv_writer.writerows(chunk)
+        else:
+            file.writelines(encoder.encode(row) + '\n' for row in chunk)
+
+
+def _count_rows(job: ExportJob, chunks: Iterable[list]) -> Iterator[list]:
+    for chunk in chunks:
+        yield chunk
+        job.rows_written += len(chunk)
+        ExportJob.objects.filter(pk = job.pk).update(rows_written = job.rows_written, heartbeat_at = timezone.now())
+
+
+def run_export_job(job: ExportJob, storage: Optional[FileSystemStorage] = None) -> None:
+    """
+    Writes the export file straight to its place in the storage
+    and marks the job as done or failed
+    """
+    storage = storage or get_export_storage()
+    file_name = storage.get_available_name(f'{job.kind}-export-{job.pk}.{job.format}')
+    path = storage.path(file_name)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    try:
+        with open(path, 'w', newline = '', encoding = 'utf-8') as file:
+            write_chunks(job, job_chunks(job), file)
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        job.status = ExportJob.STATUS_FAILED
+        job.error = repr(e)
+    else:
+        job.status = ExportJob.STATUS_DONE
+        job.file_name = file_name
+    job.finished_at = timezone.now()
+    job.save(update_fields = ['status', 'error', 'file_name', 'finished_at', 'rows_written'])
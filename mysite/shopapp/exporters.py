@@ -0,0 +1,246 @@
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.http import HttpRequest
+
+from .models import Product, Order
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_MAX_LIMIT = 100000
+
+
+class ExportParamsError(ValueError):
+    pass
+
+
+def get_export_params(request: HttpRequest) -> tuple[int, Optional[int]]:
+    """
+    Reads ?after=<pk>&limit=<n> from the query string
+    """
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = request.GET.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        raise ExportParamsError('"after" and "limit" must be integers')
+    if after < 0:
+        raise ExportParamsError('"after" must be >= 0')
+    if limit is not None and not 0 < limit <= EXPORT_MAX_LIMIT:
+        raise ExportParamsError(f'"limit" must be between 1 and {EXPORT_MAX_LIMIT}')
+    return after, limit
+
+
+def keyset_chunks(queryset: QuerySet,
+                  after: int = 0,
+                  limit: Optional[int] = None,
+                  chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    """
+    Walks a values() queryset in pk order, one query per chunk.
+    Every query is `WHERE pk > last_pk ORDER BY pk LIMIT chunk_size`,
+    so memory use and query cost don't depend on the table size.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        chunk = list(queryset.filter(pk__gt = after).order_by('pk')[:size])
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]['pk']
+        if remaining is not None:
+            remaining -= len(chunk)
+        if len(chunk) < size:
+            return
+
+
+async def akeyset_chunks(queryset: QuerySet,
+                         after: int = 0,
+                         limit: Optional[int] = None,
+                         chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[list]:
+    """
+    Async keyset_chunks(): the event loop is free while a chunk is being fetched
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        chunk = [row async for row in queryset.filter(pk__gt = after).order_by('pk')[:size]]
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]['pk']
+        if remaining is not None:
+            remaining -= len(chunk)
+        if len(chunk) < size:
+            return
+
+
+def chunked(rows: Iterable, size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+async def achunked(rows: AsyncIterable, size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[list]:
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def merge_related(rows: Iterable[dict],
+                  pairs: Iterable[tuple],
+                  key: str) -> Iterator[dict]:
+    """
+    Attaches related pks to rows without a query per row.
+    Both inputs must be sorted by the parent pk: rows are dicts with "pk",
+    pairs are (parent_pk, related_pk) tuples, e.g. from an M2M through table.
+    """
+    pairs = iter(pairs)
+    pending = next(pairs, None)
+    for row in rows:
+        while pending is not None and pending[0] < row['pk']:
+            pending = next(pairs, None)
+        related = []
+        while pending is not None and pending[0] == row['pk']:
+            related.append(pending[1])
+            pending = next(pairs, None)
+        row[key] = related
+        yield row
+
+
+async def amerge_related(rows: AsyncIterable[dict],
+                         pairs: AsyncIterable[tuple],
+                         key: str) -> AsyncIterator[dict]:
+    """
+    Async merge_related(), with the same ordering requirements
+    """
+    pairs = aiter(pairs)
+    pending = await anext(pairs, None)
+    async for row in rows:
+        while pending is not None and pending[0] < row['pk']:
+            pending = await anext(pairs, None)
+        related = []
+        while pending is not None and pending[0] == row['pk']:
+            related.append(pending[1])
+            pending = await anext(pairs, None)
+        row[key] = related
+        yield row
+
+
+def stream_json_list(key: str, chunks: Iterable[list]) -> Iterator[str]:
+    """
+    Writes {"<key>": [...], "last_pk": <pk>} one chunk at a time.
+    Pass "last_pk" back as ?after= to resume the export.
+    """
+    encoder = DjangoJSONEncoder()
+    last_pk = None
+    separator = ''
+    yield '{%s: [' % encoder.encode(key)
+    for chunk in chunks:
+        yield separator + ', '.join(encoder.encode(row) for row in chunk)
+        separator = ', '
+        last_pk = chunk[-1]['pk']
+    yield '], "last_pk": %s}' % encoder.encode(last_pk)
+
+
+async def astream_json_list(key: str, chunks: AsyncIterable[list]) -> AsyncIterator[str]:
+    """
+    Async stream_json_list() for StreamingHttpResponse under ASGI
+    """
+    encoder = DjangoJSONEncoder()
+    last_pk = None
+    separator = ''
+    yield '{%s: [' % encoder.encode(key)
+    async for chunk in chunks:
+        yield separator + ', '.join(encoder.encode(row) for row in chunk)
+        separator = ', '
+        last_pk = chunk[-1]['pk']
+    yield '], "last_pk": %s}' % encoder.encode(last_pk)
+
+
+def product_export_queryset(pks: Optional[list] = None) -> QuerySet:
+    """
+    The whole catalogue leaves out archived products, an explicit pks selection does not
+    """
+    if pks is None:
+        return Product.active.values('pk', 'name', 'price', 'archieved')
+    return Product.objects.filter(pk__in = pks).values('pk', 'name', 'price', 'archieved')
+
+
+def product_export_chunks(after: int = 0,
+                          limit: Optional[int] = None,
+                          pks: Optional[list] = None) -> Iterator[list]:
+    return keyset_chunks(product_export_queryset(pks), after = after, limit = limit)
+
+
+def aproduct_export_chunks(after: int = 0, limit: Optional[int] = None) -> AsyncIterator[list]:
+    return akeyset_chunks(product_export_queryset(), after = after, limit = limit)
+
+
+ORDER_EXPORT_FIELDS = {
+    'pk': 'pk',
+    'delivery address': 'delivery_address',
+    'promocode': 'promocode',
+    'user_id': 'user_id',
+    'items_count': 'items_count',
+    'total_price': 'total_price',
+}
+
+
+def order_export_querysets(after: int = 0,
+                           limit: Optional[int] = None,
+                           pks: Optional[list] = None) -> tuple[QuerySet, QuerySet]:
+    """
+    Order rows as values_list() tuples and (order_id, product_id) pairs, both in order pk order
+    """
+    orders = (
+        Order.objects
+        .filter(pk__gt = after)
+        .order_by('pk')
+        .values_list(*ORDER_EXPORT_FIELDS.values())
+    )
+    order_products = (
+        Order.products.through.objects
+        .filter(order_id__gt = after)
+        .order_by('order_id', 'product__name')
+        .values_list('order_id', 'product_id')
+    )
+    if pks is not None:
+        orders = orders.filter(pk__in = pks)
+        order_products = order_products.filter(order_id__in = pks)
+    if limit is not None:
+        orders = orders[:limit]
+    return orders, order_products
+
+
+def order_export_rows(after: int = 0,
+                      limit: Optional[int] = None,
+                      pks: Optional[list] = None) -> Iterator[dict]:
+    """
+    Orders with their product pks, in two queries whatever the number of orders:
+    one over orders and one over the orders-products table, merged in pk order.
+    """
+    orders, order_products = order_export_querysets(after, limit, pks)
+    return merge_related(
+        (dict(zip(ORDER_EXPORT_FIELDS, row)) for row in orders.iterator(chunk_size = EXPORT_CHUNK_SIZE)),
+        order_products.iterator(chunk_size = EXPORT_CHUNK_SIZE),
+        'products'
+    )
+
+
+def aorder_export_rows(after: int = 0, limit: Optional[int] = None) -> AsyncIterator[dict]:
+    orders, order_products = order_export_querysets(after, limit)
+    # in Django 4.2 aiterator() over values_list() runs its query in the event loop, values() does not
+    orders = orders.values(*ORDER_EXPORT_FIELDS.values()).aiterator(chunk_size = EXPORT_CHUNK_SIZE)
+    order_products = order_products.values('order_id', 'product_id').aiterator(chunk_size = EXPORT_CHUNK_SIZE)
+    return amerge_related(
+        ({key: row[field] for key, field in ORDER_EXPORT_FIELDS.items()} async for row in orders),
+        ((pair['order_id'], pair['product_id']) async for pair in order_products),
+        'products'
+    )
@@ -3,6 +3,7 @@ from django.contrib.auth.models import Group
 from django.forms import ModelForm
 
 from .models import Product, Order
+from .widgets import PickerSelect, PickerSelectMultiple
 
 
 class ProductForm(forms.ModelForm):
@@ -15,6 +16,11 @@ class OrderForm(forms.ModelForm):
     class Meta:
         model = Order
         fields = 'user', 'products', 'promocode', 'delivery_address'
+        # only the selected user and products are rendered, the rest is fetched while typing
+        widgets = {
+            'user': PickerSelect('shopapp:users_picker'),
+            'products': PickerSelectMultiple('shopapp:products_picker'),
+        }
 
 
 class GroupForm(ModelForm):
@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from shopapp.models import Order
+
+
+class Command(BaseCommand):
+    """
+    Recalculates Order.items_count and Order.total_price, one pk range per UPDATE
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        updated = 0
+        while True:
+            pks = list(
+                Order.objects.filter(pk__gt = last_pk).order_by('pk').values_list('pk', flat = True)[:batch_size]
+            )
+            if not pks:
+                break
+            with transaction.atomic():
+                updated += Order.objects.filter(pk__gte = pks[0], pk__lte = pks[-1]).update_totals()
+            last_pk = pks[-1]
+            self.stdout.write(f'Updated {updated} orders')
+        self.stdout.write(self.style.SUCCESS(f'Order totals recalculated for {updated} orders'))
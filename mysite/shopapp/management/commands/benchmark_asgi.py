@@ -0,0 +1,147 @@
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import uuid
+from contextlib import contextmanager
+from typing import Iterator
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.test import Client
+
+from shopapp.benchmarking import load_test, server_urls, wait_for_port
+from shopapp.models import Product
+
+SERVERS = {
+    'uvicorn': ['-m', 'uvicorn', 'mysite.asgi:application', '--host', '{host}', '--port', '{port}',
+                '--workers', '{workers}', '--no-access-log', '--log-level', 'warning'],
+    'hypercorn': ['-m', 'hypercorn', 'mysite.asgi:application', '--bind', '{host}:{port}', '--workers', '{workers}'],
+    'daphne': ['-m', 'daphne', '-b', '{host}', '-p', '{port}', 'mysite.asgi:application'],
+    'gunicorn': ['-m', 'gunicorn', 'mysite.wsgi:application', '--bind', '{host}:{port}',
+                 '--workers', '{workers}', '--threads', '{threads}'],
+    # the threaded development server, for when gunicorn is not installed
+    'runserver': ['manage.py', 'runserver', '{host}:{port}', '--noreload'],
+}
+ASGI_SERVERS = 'uvicorn', 'hypercorn', 'daphne'
+WSGI_SERVERS = 'gunicorn', 'runserver'
+
+
+class Command(BaseCommand):
+    """
+    Load-tests the shop read views under a WSGI server and their async versions under
+    an ASGI server, with many concurrent clients. Reports requests per second and tail
+    latency as JSON. Uses the configured database, so seed it first (seed_load_data).
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--asgi-server', choices = ASGI_SERVERS, default = 'uvicorn')
+        parser.add_argument('--wsgi-server', choices = WSGI_SERVERS, default = 'gunicorn')
+        parser.add_argument('--host', default = '127.0.0.1')
+        parser.add_argument('--port', type = int, default = 8765)
+        parser.add_argument('--workers', type = int, default = 1)
+        parser.add_argument('--threads', type = int, default = 8, help = 'Threads per WSGI worker')
+        parser.add_argument('--concurrency', type = int, default = 200)
+        parser.add_argument('--requests', type = int, default = 2000, help = 'Requests per endpoint')
+        parser.add_argument('--output', help = 'Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        for server in (options['asgi_server'], options['wsgi_server']):
+            if server != 'runserver' and importlib.util.find_spec(server) is None:
+                raise CommandError(f'{server} is not installed')
+
+        product_pk = Product.active.order_by('pk').values_list('pk', flat = True).first()
+        urls = server_urls(product_pk)
+        runs = [
+            ('wsgi', options['wsgi_server'], 0),
+            ('asgi', options['asgi_server'], 1),
+            # sync views under ASGI run in a thread, which is what the async views avoid
+            ('asgi_sync_views', options['asgi_server'], 0),
+        ]
+        results = {}
+        with self.staff_cookie() as cookie:
+            for name, server, url_index in runs:
+                self.stderr.write(f'Benchmarking {name} ({server})')
+                with self.run_server(server, options):
+                    results[name] = {
+                        endpoint: asyncio.run(self.load(options, endpoint_urls[url_index], cookie))
+                        for endpoint, endpoint_urls in urls.items()
+                    }
+
+        report = {
+            'servers': {'asgi': options['asgi_server'], 'wsgi': options['wsgi_server']},
+            'workers': options['workers'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'database': settings.DATABASES['default']['ENGINE'],
+            'results': results,
+        }
+        data = json.dumps(report, indent = 2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(data)
+            self.stdout.write(self.style.SUCCESS(f'Benchmark report written to {options["output"]}'))
+        else:
+            self.stdout.write(data)
+
+    @staticmethod
+    @contextmanager
+    def staff_cookie() -> Iterator[str]:
+        """
+        A session of a superuser made for this run, for the staff-only orders export.
+        The user and the session are deleted afterwards, as they live in the real database.
+        """
+        user = User.objects.create_superuser(username = f'bench-admin-{uuid.uuid4().hex[:12]}', password = None)
+        client = Client()
+        try:
+            client.force_login(user)
+            yield f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        finally:
+            client.logout()
+            user.delete()
+
+    @staticmethod
+    async def load(options: dict, url: str, cookie: str) -> dict:
+        return await load_test(
+            options['host'], options['port'], url,
+            requests = options['requests'],
+            concurrency = options['concurrency'],
+            cookie = cookie,
+        )
+
+    def run_server(self, server: str, options: dict) -> 'ServerProcess':
+        args = [
+            arg.format(host = options['host'], port = options['port'],
+                       workers = options['workers'], threads = options['threads'])
+            for arg in SERVERS[server]
+        ]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE = 'mysite.benchmark_settings')
+        return ServerProcess([sys.executable, *args], env, options['host'], options['port'])
+
+
+class ServerProcess:
+    def __init__(self, args: list[str], env: dict, host: str, port: int):
+        self.args = args
+        self.env = env
+        self.host = host
+        self.port = port
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.args, env = self.env, cwd = settings.BASE_DIR)
+        try:
+            asyncio.run(wait_for_port(self.host, self.port, timeout = 30))
+        except TimeoutError:
+            self.process.kill()
+            raise CommandError(f'{" ".join(self.args)} did not start')
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout = 10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
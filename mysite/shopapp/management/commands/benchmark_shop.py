@@ -0,0 +1,86 @@
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+import django
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from mysite.testing import isolated_caches
+from shopapp.benchmarking import benchmark_endpoints
+from shopapp.seeding import seed_load_data
+
+
+class Command(BaseCommand):
+    """
+    Seeds a throwaway test database and times the shop hot paths through the test client.
+    Prints JSON, so runs can be saved and compared across commits.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type = int, default = 100)
+        parser.add_argument('--products', type = int, default = 10000)
+        parser.add_argument('--orders', type = int, default = 2000)
+        parser.add_argument('--mean-products-per-order', type = float, default = 3)
+        parser.add_argument('--repeat', type = int, default = 20, help = 'Timed requests per endpoint')
+        parser.add_argument('--seed', type = int, default = 0)
+        parser.add_argument('--output', help = 'Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity = 0, autoclobber = True)
+        # file caches of its own, or the site would serve pages cached from the throwaway database
+        cache_dir = tempfile.TemporaryDirectory()
+        caches_override = override_settings(CACHES = isolated_caches(cache_dir.name))
+        caches_override.enable()
+        try:
+            started = time.perf_counter()
+            seed_load_data(
+                users = options['users'],
+                products = options['products'],
+                orders = options['orders'],
+                mean_products_per_order = options['mean_products_per_order'],
+                seed = options['seed'],
+            )
+            seed_seconds = time.perf_counter() - started
+            with override_settings(RATE_LIMIT_DEFAULT = None, RATE_LIMITS = {}):
+                endpoints = benchmark_endpoints(options['repeat'])
+        finally:
+            caches_override.disable()
+            cache_dir.cleanup()
+            connection.creation.destroy_test_db(old_name, verbosity = 0)
+            teardown_test_environment()
+
+        report = {
+            'commit': self.get_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                key: options[key]
+                for key in ('users', 'products', 'orders', 'mean_products_per_order', 'seed')
+            },
+            'seed_seconds': round(seed_seconds, 2),
+            'repeat': options['repeat'],
+            'endpoints': endpoints,
+        }
+        data = json.dumps(report, indent = 2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(data)
+            self.stdout.write(self.style.SUCCESS(f'Benchmark report written to {options["output"]}'))
+        else:
+            self.stdout.write(data)
+
+    @staticmethod
+    def get_commit() -> str:
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output = True, text = True, check = True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ''
@@ -0,0 +1,71 @@
+import re
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q, QuerySet
+
+from shopapp.models import Product, Order
+
+# "SCAN table" without "USING ... INDEX" on SQLite, "Seq Scan on table" on PostgreSQL
+SEQ_SCAN_PATTERNS = (
+    re.compile(r'\bSCAN (?!.*\bUSING\b.*\bINDEX\b)'),
+    re.compile(r'\bSeq Scan on\b'),
+)
+
+
+def query_shapes() -> dict[str, QuerySet]:
+    """
+    The queries behind the shop list, detail and export pages
+    """
+    through = Order.products.through.objects
+    return {
+        'products list': Product.active.order_by('name', 'pk')[:20],
+        'products list after cursor': (
+            Product.active
+            .filter(Q(name__gt = 'M') | Q(name = 'M', pk__gt = 1))
+            .order_by('name', 'pk')[:20]
+        ),
+        'product details': Product.objects.filter(pk = 1),
+        'products export': Product.active.filter(pk__gt = 0).order_by('pk').values('pk', 'name', 'price')[:2000],
+        'orders of user': Order.objects.filter(user_id = 1).order_by('created_at'),
+        'orders by date': Order.objects.order_by('created_at')[:20],
+        'orders export': Order.objects.filter(pk__gt = 0).order_by('pk').values_list('pk', 'promocode'),
+        'products of orders': (
+            through.filter(order_id__gt = 0).order_by('order_id').values_list('order_id', 'product_id')
+        ),
+        'orders of product': through.filter(product_id = 1).values_list('order_id', flat = True),
+    }
+
+
+class Command(BaseCommand):
+    """
+    Prints the query plans of the shop queries and flags sequential scans.
+    Planners may still choose a scan on small tables, so run it against realistic data.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail-on-seq-scan',
+            action = 'store_true',
+            help = 'Exit with an error if any scan is found',
+        )
+
+    def handle(self, *args, **options):
+        flagged = []
+        for name, queryset in query_shapes().items():
+            plan = queryset.explain()
+            scans = [
+                line for line in plan.splitlines()
+                if any(pattern.search(line) for pattern in SEQ_SCAN_PATTERNS)
+            ]
+            if scans:
+                flagged.append(name)
+                self.stdout.write(self.style.WARNING(f'{name}: sequential scan'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+            self.stdout.write(plan + '\n')
+
+        if not flagged:
+            self.stdout.write(self.style.SUCCESS(f'No sequential scans ({connection.vendor})'))
+        elif options['fail_on_seq_scan']:
+            raise CommandError(f'Sequential scans in: {", ".join(flagged)}')
@@ -0,0 +1,130 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+from typing import Iterator, TextIO
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from shopapp.cache import bump_catalogue_generation
+from shopapp.forms import ProductForm
+from shopapp.models import Product, Order
+from shopapp.search import reindex_products
+
+
+class Command(BaseCommand):
+    """
+    Imports products from CSV or NDJSON in batches of bulk upserts.
+
+    Rows are validated with ProductForm. Rows with an "id" update that product
+    (name, description, price, discount), rows without one create a new product.
+    Rejected rows go to a side file as NDJSON with their line number and errors.
+    """
+
+    help = 'Import products from a CSV/NDJSON file or stdin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help = 'File to import, "-" for stdin')
+        parser.add_argument('--format', choices = ['csv', 'ndjson'], help = 'Defaults to the file extension')
+        parser.add_argument('--created-by', required = True, help = 'Username set as created_by of new products')
+        parser.add_argument('--batch-size', type = int, default = 1000)
+        parser.add_argument('--rejects', help = 'Rejected rows file, defaults to <path>.rejects.ndjson')
+
+    def handle(self, *args, **options):
+        try:
+            created_by = User.objects.get(username = options['created_by'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["created_by"]!r} does not exist')
+        path = options['path']
+        import_format = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        rejects_path = options['rejects'] or ('rejects.ndjson' if path == '-' else f'{path}.rejects.ndjson')
+
+        imported = rejected = 0
+        started = time.perf_counter()
+        source = sys.stdin if path == '-' else open(path, newline = '', encoding = 'utf-8')
+        try:
+            with open(rejects_path, 'w', encoding = 'utf-8') as rejects:
+                rows = self.read_rows(source, import_format)
+                while batch := list(islice(rows, options['batch_size'])):
+                    products = []
+                    for line, row in batch:
+                        product = self.build_product(row, created_by)
+                        if isinstance(product, Product):
+                            products.append(product)
+                        else:
+                            rejected += 1
+                            rejects.write(json.dumps({'line': line, 'row': row, 'errors': product}) + '\n')
+                    self.save_batch(products)
+                    imported += len(products)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f'{imported} rows imported, {imported / elapsed:.0f} rows/sec')
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} products in {elapsed:.1f}s ({imported / elapsed:.0f} rows/sec)'
+        ))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f'{rejected} rows rejected, see {rejects_path}'))
+
+    @staticmethod
+    def read_rows(source: TextIO, import_format: str) -> Iterator[tuple[int, dict]]:
+        if import_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line, text in enumerate(source, start = 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = {'raw': text.rstrip('\n')}
+            yield line, row if isinstance(row, dict) else {'raw': row}
+
+    @staticmethod
+    def build_product(row: dict, created_by: User):
+        """
+        Returns an unsaved Product, or the validation errors of the row
+        """
+        form = ProductForm(data = row)
+        errors = {} if form.is_valid() else form.errors.get_json_data()
+        pk = row.get('id') or None
+        if pk is not None:
+            try:
+                pk = int(pk)
+            except (TypeError, ValueError):
+                errors['id'] = [{'message': 'Enter a whole number.', 'code': 'invalid'}]
+        if errors:
+            return errors
+        product = form.save(commit = False)
+        product.pk = pk
+        product.created_by = created_by
+        return product
+
+    @staticmethod
+    def save_batch(products: list[Product]) -> None:
+        with transaction.atomic():
+            # pks of new rows are not returned by an upsert, but they come after the current last pk
+            last_pk = Product.objects.order_by('-pk').values_list('pk', flat = True).first() or 0
+            Product.objects.bulk_create(
+                products,
+                update_conflicts = True,
+                unique_fields = ['id'],
+                update_fields = ['name', 'description', 'price', 'discount', 'updated_at'],
+            )
+            # bulk_create skips the signals that keep order totals, cached pages and the search index in sync
+            updated_pks = [product.pk for product in products if product.pk is not None]
+            if updated_pks:
+                Order.objects.filter(
+                    pk__in = Order.products.through.objects.filter(product_id__in = updated_pks).values('order_id')
+                ).update_totals()
+            reindex_products(Product.objects.filter(Q(pk__in = updated_pks) | Q(pk__gt = last_pk)))
+        bump_catalogue_generation()
@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from shopapp.search import reindex_products, search_backend
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the FTS5 product search table from the products table
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 2000)
+
+    def handle(self, *args, **options):
+        if search_backend() != 'fts5':
+            self.stdout.write('The search index of this database is kept up to date by the database itself')
+            return
+        with transaction.atomic():
+            indexed = reindex_products(batch_size = options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt for {indexed} products'))
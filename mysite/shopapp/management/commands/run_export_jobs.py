@@ -0,0 +1,32 @@
+import time
+
+from django.core.management import BaseCommand
+
+from shopapp.export_jobs import claim_next_job, run_export_job
+
+
+class Command(BaseCommand):
+    """
+    Runs queued export jobs. The queue is the ExportJob table,
+    so several workers can run side by side without a broker.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action = 'store_true', help = 'Run pending jobs and exit')
+        parser.add_argument('--poll-interval', type = float, default = 2.0, help = 'Seconds between queue polls')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Waiting for export jobs')
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            self.stdout.write(f'Running {job}')
+            run_export_job(job)
+            if job.status == job.STATUS_DONE:
+                self.stdout.write(self.style.SUCCESS(f'Exported {job.rows_written} rows to {job.file_name}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Export job {job.pk} failed: {job.error}'))
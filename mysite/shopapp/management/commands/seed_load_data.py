@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+
+from shopapp.seeding import seed_load_data
+
+
+class Command(BaseCommand):
+    """
+    Generates a reproducible dataset for benchmarks and capacity tests:
+    users with profiles, products and orders with a long-tailed number of products
+    """
+
+    help = 'Generate large amounts of users, products and orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type = int, default = 1000)
+        parser.add_argument('--products', type = int, default = 100000)
+        parser.add_argument('--orders', type = int, default = 50000)
+        parser.add_argument('--mean-products-per-order', type = float, default = 3)
+        parser.add_argument('--max-products-per-order', type = int, default = 20)
+        parser.add_argument('--seed', type = int, default = 0, help = 'Random seed, the same seed gives the same data')
+        parser.add_argument('--prefix', default = 'load', help = 'Prefix of generated usernames and product names')
+        parser.add_argument('--password', help = 'Password of the generated users, unusable by default')
+        parser.add_argument('--batch-size', type = int, default = 1000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('At least one user is needed to own products and orders')
+        if User.objects.filter(username__startswith = f'{options["prefix"]}-user-').exists():
+            raise CommandError(f'Users with prefix {options["prefix"]!r} already exist, choose another --prefix')
+
+        started = time.perf_counter()
+        counts = seed_load_data(
+            users = options['users'],
+            products = options['products'],
+            orders = options['orders'],
+            mean_products_per_order = options['mean_products_per_order'],
+            max_products_per_order = options['max_products_per_order'],
+            seed = options['seed'],
+            prefix = options['prefix'],
+            password = options['password'],
+            batch_size = options['batch_size'],
+            log = self.stdout.write,
+        )
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary} in {elapsed:.1f}s'))
@@ -1,16 +1,109 @@
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db.models import QuerySet
 
 from shopapp.models import Order, Product
 
+# Smallest number of products in one INSERT/DELETE when the batch size allows it
+MIN_PRODUCT_CHUNK = 100
+
+
+def chunks(queryset: QuerySet, size: int):
+    """
+    pks of the queryset in batches, one keyset query per batch
+    """
+    last_pk = 0
+    while chunk := list(
+        queryset.filter(pk__gt = last_pk).order_by('pk').values_list('pk', flat = True)[:size]
+    ):
+        yield chunk
+        last_pk = chunk[-1]
+
 
 class Command(BaseCommand):
+    """
+    Adds products to orders or removes them, working on the orders-products table directly.
+    Without selectors it adds all products to the first order.
+    """
+
+    help = 'Bulk edit the products of orders'
+
+    def add_arguments(self, parser):
+        orders = parser.add_argument_group('order selectors')
+        orders.add_argument('--order-ids', nargs = '+', type = int, metavar = 'PK')
+        orders.add_argument('--user', help = 'Orders of this username')
+        orders.add_argument('--all-orders', action = 'store_true')
+        products = parser.add_argument_group('product selectors')
+        products.add_argument('--product-ids', nargs = '+', type = int, metavar = 'PK')
+        products.add_argument('--name-prefix', help = 'Products whose name starts with this text')
+        products.add_argument('--active-only', action = 'store_true', help = 'Skip archived products')
+        parser.add_argument('--remove', action = 'store_true', help = 'Remove the products instead of adding them')
+        parser.add_argument('--dry-run', action = 'store_true', help = 'Only report what would change')
+        parser.add_argument('--batch-size', type = int, default = 5000, help = 'Rows per INSERT/DELETE')
+
     def handle(self, *args, **options):
-        order = Order.objects.first()
-        if not order:
+        orders = self.select_orders(options)
+        products = self.select_products(options)
+        if not orders.exists():
             self.stdout.write('No order found')
             return
-        products = Product.objects.all()
-        for product in products:
-            order.products.add(product)
-        order.save()
-        self.stdout.write(self.style.SUCCESS(f"Successfully added products {order.products.all()} to order {order}"))
+
+        through = Order.products.through.objects
+        existing = through.filter(order__in = orders, product__in = products).count()
+        if options['remove']:
+            changes = existing
+        else:
+            changes = orders.count() * products.count() - existing
+        if options['dry_run']:
+            verb = 'remove' if options['remove'] else 'add'
+            self.stdout.write(f'Would {verb} {changes} order-product links')
+            return
+
+        batch_size = options['batch_size']
+        # few enough orders per batch that each statement still covers MIN_PRODUCT_CHUNK products
+        orders_per_batch = max(1, batch_size // MIN_PRODUCT_CHUNK)
+        for order_ids in chunks(orders, orders_per_batch):
+            # each INSERT/DELETE commits on its own, so no transaction grows with the selection;
+            # an interrupted run is finished by running the command again
+            for product_ids in chunks(products, max(1, batch_size // len(order_ids))):
+                if options['remove']:
+                    through.filter(order_id__in = order_ids, product_id__in = product_ids).delete()
+                else:
+                    through.bulk_create(
+                        [
+                            Order.products.through(order_id = order_id, product_id = product_id)
+                            for order_id in order_ids
+                            for product_id in product_ids
+                        ],
+                        ignore_conflicts = True,
+                    )
+            # bulk operations on the through table skip m2m_changed
+            Order.objects.filter(pk__in = order_ids).update_totals()
+            self.stdout.write(f'Processed {len(order_ids)} orders')
+
+        verb = 'removed' if options['remove'] else 'added'
+        self.stdout.write(self.style.SUCCESS(f'Successfully {verb} {changes} order-product links'))
+
+    @staticmethod
+    def select_orders(options) -> QuerySet:
+        if options['all_orders']:
+            return Order.objects.all()
+        if options['order_ids'] or options['user']:
+            orders = Order.objects.all()
+            if options['order_ids']:
+                orders = orders.filter(pk__in = options['order_ids'])
+            if options['user']:
+                orders = orders.filter(user__username = options['user'])
+            return orders
+        first = Order.objects.order_by('pk').values('pk')[:1]
+        return Order.objects.filter(pk__in = first)
+
+    @staticmethod
+    def select_products(options) -> QuerySet:
+        products = Product.active.all() if options['active_only'] else Product.objects.all()
+        if options['product_ids']:
+            products = products.filter(pk__in = options['product_ids'])
+        if options['name_prefix']:
+            products = products.filter(name__startswith = options['name_prefix'])
+        if options['remove'] and not (options['product_ids'] or options['name_prefix'] or options['active_only']):
+            raise CommandError('Select the products to remove')
+        return products
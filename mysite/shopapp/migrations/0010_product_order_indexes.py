@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0009_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('archieved', False)), fields=['name', 'id'], name='product_active_name_idx'),
+        ),
+        # The auto-created through table only has the (order_id, product_id) unique index,
+        # this one covers lookups of the orders of a product.
+        migrations.RunSQL(
+            sql='CREATE INDEX order_products_product_order_idx ON shopapp_order_products (product_id, order_id)',
+            reverse_sql='DROP INDEX order_products_product_order_idx',
+        ),
+    ]
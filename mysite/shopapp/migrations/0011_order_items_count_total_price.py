@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:49
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 5000
+
+
+def fill_order_totals(apps, schema_editor):
+    # the same calculation as OrderQuerySet.update_totals(), which historical models do not have
+    Order = apps.get_model('shopapp', 'Order')
+    OrderProduct = Order.products.through
+    order_products = (
+        OrderProduct.objects
+        .filter(order_id = models.OuterRef('pk'))
+        .order_by()
+        .values('order_id')
+    )
+    items_count = order_products.annotate(count = models.Count('pk')).values('count')
+    total_price = order_products.annotate(
+        total = models.Sum(
+            models.F('product__price') * (100 - models.F('product__discount')) * Decimal('0.01'),
+            output_field = models.DecimalField(max_digits = 12, decimal_places = 2),
+        )
+    ).values('total')
+    last_pk = 0
+    while pks := list(
+        Order.objects.filter(pk__gt = last_pk).order_by('pk').values_list('pk', flat = True)[:BATCH_SIZE]
+    ):
+        Order.objects.filter(pk__gte = pks[0], pk__lte = pks[-1]).update(
+            items_count = Coalesce(models.Subquery(items_count), 0),
+            total_price = Coalesce(
+                models.Subquery(total_price),
+                Decimal(0),
+                output_field = models.DecimalField(max_digits = 12, decimal_places = 2),
+            ),
+        )
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0010_product_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+FTS_TABLE = 'shopapp_product_fts'
+SEARCH_INDEX = 'product_search_idx'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        # trigram tokens make substring search an index lookup instead of a LIKE scan
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, description, tokenize = 'trigram')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) SELECT id, name, description FROM shopapp_product'
+        )
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        # must stay the same expression as shopapp.search.search_vector() for queries to use it
+        index = GinIndex(SearchVector('name', 'description', config = 'simple'), name = SEARCH_INDEX)
+        schema_editor.add_index(apps.get_model('shopapp', 'Product'), index)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX {SEARCH_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0012_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
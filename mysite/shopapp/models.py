@@ -1,11 +1,59 @@
 # coding=utf-8
+import hashlib
+from decimal import Decimal
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from .cache import bump_catalogue_generation
+
+
+class ProductQuerySet(models.QuerySet):
+    def active(self) -> 'ProductQuerySet':
+        return self.filter(archieved = False)
+
+    def archived(self) -> 'ProductQuerySet':
+        return self.filter(archieved = True)
+
+    def archive(self) -> int:
+        """
+        Soft-deletes the products with a single-column UPDATE, without loading them
+        """
+        return self._set_archieved(True)
+
+    def unarchive(self) -> int:
+        return self._set_archieved(False)
+
+    def _set_archieved(self, value: bool) -> int:
+        # update() skips post_save, so the cached catalogue pages are retired here
+        updated = self.order_by().update(archieved = value, updated_at = timezone.now())
+        bump_catalogue_generation()
+        return updated
+
+
+class ActiveProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    """
+    Products that are not archived. The filter matches the condition of
+    product_active_name_idx, so catalogue queries ordered by name use that index.
+    """
+
+    def get_queryset(self) -> ProductQuerySet:
+        return super().get_queryset().active()
 
 
 class Product(models.Model):
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(
+                fields = ['name', 'id'],
+                condition = models.Q(archieved = False),
+                name = 'product_active_name_idx',
+            ),
+            models.Index(fields = ['updated_at'], name = 'product_updated_idx'),
+        ]
 
     name = models.CharField(max_length = 100)
     description = models.TextField(null = False, blank = True)
@@ -14,6 +62,11 @@ class Product(models.Model):
     created_at = models.DateField(auto_now_add = True)
     archieved = models.BooleanField(default = False)
     created_by = models.ForeignKey(User, on_delete = models.DO_NOTHING, blank = True)
+    updated_at = models.DateTimeField(auto_now = True)
+
+    # the first manager is the default one, so the admin and related lookups still see archived products
+    objects = ProductQuerySet.as_manager()
+    active = ActiveProductManager()
 
     # @property
     # def description_short(self) -> str:
@@ -21,13 +74,122 @@ class Product(models.Model):
     #         return self.description
     #     return self.description[:50] + '...'
 
+    @property
+    def cache_version(self) -> str:
+        """
+        Stamp of the displayed fields, part of the key of cached product fragments
+        """
+        data = f'{self.name}|{self.description}|{self.price}|{self.discount}|{self.archieved}'
+        return hashlib.md5(data.encode(), usedforsecurity = False).hexdigest()
+
     def __str__(self) -> str:
         return f'Product (pk={self.pk}, name={self.name!r})'
 
 
+class OrderQuerySet(models.QuerySet):
+    def update_totals(self) -> int:
+        """
+        Recalculates items_count and total_price of these orders in one UPDATE.
+        Also touches updated_at, since the products of the orders have changed.
+        """
+        order_products = (
+            Order.products.through.objects
+            .filter(order_id = models.OuterRef('pk'))
+            .order_by()
+            .values('order_id')
+        )
+        items_count = order_products.annotate(count = models.Count('pk')).values('count')
+        total_price = order_products.annotate(
+            total = models.Sum(
+                models.F('product__price') * (100 - models.F('product__discount')) * Decimal('0.01'),
+                output_field = models.DecimalField(max_digits = 12, decimal_places = 2),
+            )
+        ).values('total')
+        return self.order_by().update(
+            updated_at = Now(),
+            items_count = Coalesce(models.Subquery(items_count), 0),
+            total_price = Coalesce(
+                models.Subquery(total_price),
+                Decimal(0),
+                output_field = models.DecimalField(max_digits = 12, decimal_places = 2),
+            ),
+        )
+
+
 class Order(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields = ['user', 'created_at'], name = 'order_user_created_idx'),
+            models.Index(fields = ['created_at'], name = 'order_created_idx'),
+            models.Index(fields = ['updated_at'], name = 'order_updated_idx'),
+        ]
+
     delivery_address = models.TextField(null = True, blank = True)
     promocode = models.CharField(max_length = 20, null = False, blank = True)
     created_at = models.DateField(auto_now_add = True)
+    updated_at = models.DateTimeField(auto_now = True)
     user = models.ForeignKey(User, on_delete = models.PROTECT)
     products = models.ManyToManyField(Product, related_name = 'orders')
+    # Kept in sync by shopapp.signals, rebuilt by the backfill_order_totals command
+    items_count = models.PositiveIntegerField(default = 0)
+    total_price = models.DecimalField(default = 0, max_digits = 12, decimal_places = 2)
+
+    objects = OrderQuerySet.as_manager()
+
+    def __str__(self) -> str:
+        return f'Order (pk={self.pk}, delivery_address={self.delivery_address!r})'
+
+
+class ExportJob(models.Model):
+    """
+    Export queued from the shop or the admin and run by the run_export_jobs command
+    """
+
+    class Meta:
+        ordering = ['-pk']
+
+    KIND_PRODUCTS = 'products'
+    KIND_ORDERS = 'orders'
+    KIND_CHOICES = [
+        (KIND_PRODUCTS, 'Products'),
+        (KIND_ORDERS, 'Orders'),
+    ]
+
+    FORMAT_CSV = 'csv'
+    FORMAT_JSON = 'json'
+    FORMAT_NDJSON = 'ndjson'
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, 'CSV'),
+        (FORMAT_JSON, 'JSON'),
+        (FORMAT_NDJSON, 'NDJSON'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length = 20, choices = KIND_CHOICES)
+    format = models.CharField(max_length = 10, choices = FORMAT_CHOICES, default = FORMAT_JSON)
+    status = models.CharField(max_length = 10, choices = STATUS_CHOICES, default = STATUS_PENDING)
+    pks = models.JSONField(null = True, blank = True)
+    # query string of the admin changelist after "select all", resolved by the worker instead of pks
+    changelist_query = models.TextField(null = True, blank = True)
+    rows_written = models.PositiveBigIntegerField(default = 0)
+    file_name = models.CharField(max_length = 255, blank = True)
+    error = models.TextField(blank = True)
+    created_by = models.ForeignKey(User, on_delete = models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add = True)
+    started_at = models.DateTimeField(null = True, blank = True)
+    # refreshed by the worker after every chunk, a running job without it for long is abandoned
+    heartbeat_at = models.DateTimeField(null = True, blank = True)
+    finished_at = models.DateTimeField(null = True, blank = True)
+
+    def __str__(self) -> str:
+        return f'ExportJob (pk={self.pk}, kind={self.kind!r}, status={self.status!r})'
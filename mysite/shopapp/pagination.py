@@ -0,0 +1,80 @@
+from django.db.models import Q, QuerySet
+from django.http import Http404
+
+
+class KeysetPaginationMixin:
+    """
+    ListView pagination with a ?page_size= override and an opt-in keyset mode.
+
+    ?page=<n> uses the regular Paginator. ?after=<pk> continues the list right after
+    that object: the query filters on the ordering columns instead of using OFFSET and
+    skips COUNT(*), so deep pages cost the same as the first one. The queryset must be
+    ordered by `keyset_ordering`, which has to end with a unique field.
+    """
+
+    paginate_by = 20
+    max_paginate_by = 100
+    keyset_ordering = ('pk',)
+
+    def get_paginate_by(self, queryset: QuerySet) -> int:
+        try:
+            page_size = int(self.request.GET.get('page_size', self.paginate_by))
+        except ValueError:
+            page_size = self.paginate_by
+        return max(1, min(page_size, self.max_paginate_by))
+
+    def get_queryset(self) -> QuerySet:
+        return super().get_queryset().order_by(*self.keyset_ordering)
+
+    def paginate_queryset(self, queryset: QuerySet, page_size: int):
+        after = self.request.GET.get('after')
+        if after is None:
+            return super().paginate_queryset(queryset, page_size)
+        return None, None, self.keyset_page(queryset, page_size), True
+
+    def keyset_page(self, queryset: QuerySet, page_size: int) -> list:
+        """
+        Keyset mode for views without a Paginator: the first page, or the page ?after=<pk>
+        """
+        after = self.request.GET.get('after')
+        if after is not None:
+            try:
+                cursor = queryset.model._default_manager.filter(pk = int(after)).values(*self.keyset_ordering).get()
+            except (ValueError, queryset.model.DoesNotExist):
+                raise Http404('Invalid cursor')
+            queryset = queryset.filter(self.keyset_filter(cursor))
+        object_list = list(queryset.order_by(*self.keyset_ordering)[:page_size + 1])
+        self.next_after = object_list[page_size - 1].pk if len(object_list) > page_size else None
+        return object_list[:page_size]
+
+    async def akeyset_page(self, queryset: QuerySet, page_size: int) -> list:
+        """
+        Async keyset_page()
+        """
+        after = self.request.GET.get('after')
+        if after is not None:
+            try:
+                cursor = await queryset.model._default_manager.filter(pk = int(after)).values(*self.keyset_ordering).aget()
+            except (ValueError, queryset.model.DoesNotExist):
+                raise Http404('Invalid cursor')
+            queryset = queryset.filter(self.keyset_filter(cursor))
+        object_list = [obj async for obj in queryset.order_by(*self.keyset_ordering)[:page_size + 1]]
+        self.next_after = object_list[page_size - 1].pk if len(object_list) > page_size else None
+        return object_list[:page_size]
+
+    def keyset_filter(self, cursor: dict) -> Q:
+        """
+        Rows sorting after the cursor: (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for field in self.keyset_ordering:
+            condition |= equal & Q(**{f'{field}__gt': cursor[field]})
+            equal &= Q(**{field: cursor[field]})
+        return condition
+
+    def get_context_data(self, **kwargs) -> dict:
+        context = super().get_context_data(**kwargs)
+        context['page_size'] = self.get_paginate_by(None)
+        context['next_after'] = getattr(self, 'next_after', None)
+        return context
@@ -0,0 +1,141 @@
+from typing import Iterable, Optional
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, QuerySet
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+FTS_TABLE = 'shopapp_product_fts'
+# the trigram tokenizer indexes every 3-character substring, shorter terms cannot be looked up
+MIN_TERM_LENGTH = 3
+# bm25() weights of the name and description columns
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def search_backend() -> Optional[str]:
+    """
+    'fts5' on SQLite, 'tsvector' on PostgreSQL, None where there is no index to use
+    """
+    if connection.vendor == 'sqlite':
+        return 'fts5'
+    if connection.vendor == 'postgresql':
+        return 'tsvector'
+    return None
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    # the migration builds the GIN index from this same expression, so queries can use it
+    return SearchVector('name', 'description', config = 'simple')
+
+
+def fts_query(terms: list[str]) -> str:
+    """
+    Quotes every term as an FTS5 string, so the user's input is never parsed as query syntax
+    """
+    return ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+
+
+def search_products(queryset: QuerySet, query: str, ranked: bool = True) -> QuerySet:
+    """
+    Products of the queryset that contain every word of the query in the name or
+    the description. With ranked=True they are annotated with `rank` and sorted
+    by it, best first.
+    """
+    terms = query.split()
+    if not terms:
+        return queryset.none()
+    backend = search_backend()
+    if backend == 'tsvector':
+        return _search_tsvector(queryset, query, ranked)
+
+    indexed = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    if backend is None or not indexed:
+        return _search_scan(queryset, terms)
+    match = fts_query(indexed)
+    queryset = queryset.filter(pk__in = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+    # short terms only narrow down the rows the index has already found
+    queryset = _search_scan(queryset, [term for term in terms if len(term) < MIN_TERM_LENGTH])
+    if not ranked:
+        return queryset
+    rank = RawSQL(
+        f'SELECT -bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = {Product._meta.db_table}.id',
+        [NAME_WEIGHT, DESCRIPTION_WEIGHT, match],
+        output_field = FloatField(),
+    )
+    return queryset.annotate(rank = rank).order_by('-rank', 'name', 'pk')
+
+
+def _search_tsvector(queryset: QuerySet, query: str, ranked: bool) -> QuerySet:
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    search_query = SearchQuery(query, config = 'simple', search_type = 'websearch')
+    queryset = queryset.annotate(search = search_vector()).filter(search = search_query)
+    if not ranked:
+        return queryset
+    return queryset.annotate(rank = SearchRank(F('search'), search_query)).order_by('-rank', 'name', 'pk')
+
+
+def _search_scan(queryset: QuerySet, terms: list[str]) -> QuerySet:
+    for term in terms:
+        queryset = queryset.filter(Q(name__icontains = term) | Q(description__icontains = term))
+    return queryset
+
+
+def indexed_prefix(field: str, prefix: str) -> Q:
+    """
+    Case-sensitive "starts with" that an index on the field can serve.
+    SQLite only uses an index for LIKE under special collations, so there the prefix
+    becomes a range; PostgreSQL has a varchar_pattern_ops index on every indexed CharField.
+    """
+    if connection.vendor == 'postgresql':
+        return Q(**{f'{field}__startswith': prefix})
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+
+
+def index_products(products: Iterable[Product]) -> None:
+    """
+    Writes the products to the FTS5 table, replacing their previous entries
+    """
+    if search_backend() != 'fts5':
+        return
+    rows = [(product.pk, product.name, product.description) for product in products]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', rows)
+
+
+def unindex_products(pks: Iterable[int]) -> None:
+    if search_backend() != 'fts5':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in pks])
+
+
+def reindex_products(queryset: Optional[QuerySet] = None, batch_size: int = 2000) -> int:
+    """
+    Rebuilds the entries of the given products, or of the whole catalogue.
+    For writes that skip the post_save signal, like bulk_create().
+    """
+    if search_backend() != 'fts5':
+        return 0
+    if queryset is None:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        queryset = Product.objects.all()
+    batch = []
+    count = 0
+    for product in queryset.only('pk', 'name', 'description').order_by('pk').iterator(chunk_size = batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            index_products(batch)
+            count += len(batch)
+            batch = []
+    index_products(batch)
+    return count + len(batch)
@@ -0,0 +1,179 @@
+import random
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Callable, Iterable, Iterator, Optional
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Model
+
+from myauth.models import Profile
+from .cache import bump_catalogue_generation
+from .models import Product, Order
+from .search import reindex_products
+
+BATCH_SIZE = 1000
+
+
+def batched_create(model: type[Model], objects: Iterable[Model], batch_size: int) -> int:
+    """
+    bulk_create() materializes its input, so feed it one batch at a time
+    """
+    created = 0
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            created += len(model.objects.bulk_create(batch))
+            batch = []
+    if batch:
+        created += len(model.objects.bulk_create(batch))
+    return created
+
+
+def products_per_order(rng: random.Random, mean: float, maximum: int) -> int:
+    """
+    Long-tailed basket size: most orders hold a few products, some hold many
+    """
+    if mean <= 1:
+        return 1
+    return min(maximum, 1 + int(rng.expovariate(1 / (mean - 1))))
+
+
+def popular_products(rng: random.Random, product_ids: list[int]) -> Callable[[], int]:
+    """
+    Picks products with Zipf-like popularity, so a few products appear in many orders
+    """
+    order = product_ids[:]
+    rng.shuffle(order)
+    cum_weights = list(accumulate(1 / rank for rank in range(1, len(order) + 1)))
+    total = cum_weights[-1]
+    return lambda: order[bisect_left(cum_weights, rng.random() * total)]
+
+
+def seed_load_data(users: int,
+                   products: int,
+                   orders: int,
+                   mean_products_per_order: float = 3,
+                   max_products_per_order: int = 20,
+                   seed: int = 0,
+                   prefix: str = 'load',
+                   password: Optional[str] = None,
+                   batch_size: int = BATCH_SIZE,
+                   log: Callable[[str], None] = lambda message: None) -> dict:
+    """
+    Generates users with profiles, products and orders with bulk inserts only.
+    The same arguments always produce the same data.
+    """
+    rng = random.Random(seed)
+    # hashing is slow on purpose, so every user shares one hash
+    password_hash = make_password(password) if password else make_password(None)
+    username_prefix = f'{prefix}-user-'
+
+    with transaction.atomic():
+        batched_create(
+            User,
+            (User(username = f'{username_prefix}{i}', password = password_hash) for i in range(users)),
+            batch_size,
+        )
+        user_ids = list(
+            User.objects.filter(username__startswith = username_prefix).order_by('pk').values_list('pk', flat = True)
+        )
+        batched_create(
+            Profile,
+            (Profile(user_id = user_id, bio = f'Load test user {user_id}') for user_id in user_ids),
+            batch_size,
+        )
+    log(f'Created {len(user_ids)} users with profiles')
+
+    first_product_pk = _next_pk(Product)
+    with transaction.atomic():
+        batched_create(
+            Product,
+            (
+                Product(
+                    name = f'{prefix.title()} product {i}',
+                    description = f'Description of product {i}. ' * rng.randint(1, 10),
+                    price = rng.randint(100, 200000) / 100,
+                    discount = rng.choice((0, 0, 0, 5, 10, 15, 25)),
+                    archieved = rng.random() < 0.05,
+                    created_by_id = rng.choice(user_ids),
+                )
+                for i in range(products)
+            ),
+            batch_size,
+        )
+    product_ids = list(
+        Product.objects.filter(pk__gte = first_product_pk).order_by('pk').values_list('pk', flat = True)
+    )
+    reindex_products(Product.objects.filter(pk__gte = first_product_pk))
+    bump_catalogue_generation()
+    log(f'Created {len(product_ids)} products')
+
+    first_order_pk = _next_pk(Order)
+    with transaction.atomic():
+        batched_create(
+            Order,
+            (
+                Order(
+                    delivery_address = f'{rng.randint(1, 200)} Load street, apt {rng.randint(1, 500)}',
+                    promocode = rng.choice(('', '', '', 'SALE10', 'FirstOrder')),
+                    user_id = rng.choice(user_ids),
+                )
+                for _ in range(orders)
+            ),
+            batch_size,
+        )
+    order_ids = list(Order.objects.filter(pk__gte = first_order_pk).order_by('pk').values_list('pk', flat = True))
+
+    links = 0
+    if product_ids:
+        pick_product = popular_products(rng, product_ids)
+        links = batched_create(
+            Order.products.through,
+            _order_products(
+                rng,
+                order_ids,
+                product_ids,
+                pick_product,
+                mean_products_per_order,
+                min(max_products_per_order, len(product_ids)),
+            ),
+            batch_size,
+        )
+        for start in range(0, len(order_ids), batch_size):
+            batch = order_ids[start:start + batch_size]
+            Order.objects.filter(pk__gte = batch[0], pk__lte = batch[-1]).update_totals()
+    log(f'Created {len(order_ids)} orders with {links} products')
+
+    return {
+        'users': len(user_ids),
+        'products': len(product_ids),
+        'orders': len(order_ids),
+        'order_products': links,
+    }
+
+
+def _order_products(rng: random.Random,
+                    order_ids: list[int],
+                    product_ids: list[int],
+                    pick_product: Callable[[], int],
+                    mean: float,
+                    maximum: int) -> Iterator[Model]:
+    for order_id in order_ids:
+        size = products_per_order(rng, mean, maximum)
+        if size * 2 > len(product_ids):
+            # drawing rare products by popularity would take too long on a small catalogue
+            basket = set(rng.sample(product_ids, size))
+        else:
+            basket = set()
+            while len(basket) < size:
+                basket.add(pick_product())
+        for product_id in sorted(basket):
+            yield Order.products.through(order_id = order_id, product_id = product_id)
+
+
+def _next_pk(model: type[Model]) -> int:
+    last = model.objects.order_by('-pk').values_list('pk', flat = True).first()
+    return (last or 0) + 1
@@ -0,0 +1,70 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_catalogue_generation
+from .models import Product, Order
+from .search import index_products, unindex_products
+
+
+@receiver(m2m_changed, sender = Order.products.through)
+def order_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_order_ids = list(instance.orders.values_list('pk', flat = True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        order_ids = [instance.pk]
+    elif action == 'post_clear':
+        order_ids = instance.__dict__.pop('_cleared_order_ids', [])
+    else:
+        order_ids = pk_set
+    if order_ids:
+        Order.objects.filter(pk__in = order_ids).update_totals()
+
+
+def product_prices(product: Product) -> tuple:
+    return tuple(
+        Product._meta.get_field(name).to_python(getattr(product, name))
+        for name in ('price', 'discount')
+    )
+
+
+@receiver(pre_save, sender = Product)
+def product_saving(sender, instance, update_fields, **kwargs):
+    # forms and the admin save every field, so the stored prices tell whether order totals change
+    if instance.pk is None:
+        return
+    if update_fields is not None and not {'price', 'discount'} & set(update_fields):
+        return
+    instance._saved_prices = Product.objects.filter(pk = instance.pk).values_list('price', 'discount').first()
+
+
+@receiver(post_save, sender = Product)
+def product_saved(sender, instance, created, update_fields, raw, **kwargs):
+    bump_catalogue_generation()
+    if update_fields is None or {'name', 'description'} & set(update_fields):
+        index_products([instance])
+    saved_prices = instance.__dict__.pop('_saved_prices', None)
+    # fixtures may load products after the orders that link to them
+    if created and not raw:
+        return
+    if update_fields is not None and not {'price', 'discount'} & set(update_fields):
+        return
+    if saved_prices == product_prices(instance):
+        return
+    Order.objects.filter(pk__in = instance.orders.values('pk')).update_totals()
+
+
+@receiver(pre_delete, sender = Product)
+def product_deleting(sender, instance, **kwargs):
+    instance._deleted_order_ids = list(instance.orders.values_list('pk', flat = True))
+
+
+@receiver(post_delete, sender = Product)
+def product_deleted(sender, instance, **kwargs):
+    bump_catalogue_generation()
+    unindex_products([instance.pk])
+    order_ids = instance.__dict__.pop('_deleted_order_ids', [])
+    if order_ids:
+        Order.objects.filter(pk__in = order_ids).update_totals()
@@ -0,0 +1,61 @@
+// Fills <select class="picker"> from its data-picker-url as the user types.
+// The server renders only the selected options; matches are fetched a page at a time.
+(function () {
+    'use strict';
+
+    function setUp(select) {
+        const url = select.dataset.pickerUrl;
+        const search = document.createElement('input');
+        const more = document.createElement('button');
+        let next = null;
+        let timer = null;
+
+        search.type = 'search';
+        search.placeholder = 'Type to search';
+        more.type = 'button';
+        more.textContent = 'More';
+        more.hidden = true;
+        select.before(search);
+        select.after(more);
+
+        function load(append) {
+            const params = new URLSearchParams({q: search.value.trim()});
+            if (append && next !== null) {
+                params.set('after', next);
+            }
+            fetch(url + '?' + params, {headers: {'Accept': 'application/json'}})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    if (!append) {
+                        // keep what is already selected, drop the previous matches
+                        Array.from(select.options)
+                            .filter(function (option) { return !option.selected && option.value !== ''; })
+                            .forEach(function (option) { option.remove(); });
+                    }
+                    const present = new Set(Array.from(select.options).map(function (option) { return option.value; }));
+                    data.results.forEach(function (result) {
+                        if (!present.has(String(result.id))) {
+                            select.add(new Option(result.text, result.id));
+                        }
+                    });
+                    next = data.next_after;
+                    more.hidden = next === null;
+                });
+        }
+
+        search.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () { load(false); }, 250);
+        });
+        more.addEventListener('click', function () { load(true); });
+        select.addEventListener('focus', function () {
+            if (next === null && select.options.length <= 1) {
+                load(false);
+            }
+        }, {once: true});
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select.picker[data-picker-url]').forEach(setUp);
+    });
+})();
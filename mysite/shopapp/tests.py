@@ -1,14 +1,38 @@
+import asyncio
+import csv
 import datetime
+from decimal import Decimal
 from random import choices
 from string import ascii_letters
 import json
+from io import StringIO
+import os
+import tempfile
+from importlib import import_module
+import warnings
+from unittest.mock import patch
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
 from django.contrib.auth.models import User, Permission
-from django.test import TestCase
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from shopapp.models import Product, Order
+from myauth.models import Profile
+from shopapp.benchmarking import benchmark_endpoints, load_test
+from shopapp.cache import CATALOGUE_GENERATION_KEY, get_catalogue_generation
+from shopapp.export_jobs import claim_next_job, job_chunks
+from shopapp.management.commands.benchmark_asgi import Command as BenchmarkASGICommand
+from shopapp.search import reindex_products
+from shopapp.seeding import seed_load_data
+from shopapp.models import Product, Order, ExportJob
 
 
 class ProductCreateViewTestCase(TestCase):
@@ -69,6 +93,7 @@ class ProductDetailsViewTestCase(TestCase):
         self.assertContains(response, self.product.name)
 
 
+@override_settings(RATE_LIMIT_DEFAULT = None)
 class ProductsListViewTestCase(TestCase):
     fixtures = [
         'shopapp/fixtures/fixtures-product.json'
@@ -77,12 +102,28 @@ class ProductsListViewTestCase(TestCase):
     def test_products_list(self):
         response = self.client.get(reverse('shopapp:products_list'))
         self.assertQuerysetEqual(
-            qs = Product.objects.filter(archieved = False).all(),
+            qs = Product.active.all(),
             values = (p.pk for p in response.context['products']),
             transform = lambda p: p.pk
         )
         self.assertTemplateUsed(response, 'shopapp/products_list.html')
 
+    def test_products_list_keyset_pages(self):
+        expected = list(
+            Product.active.order_by('name', 'pk').values_list('pk', flat = True)
+        )
+        response = self.client.get(reverse('shopapp:products_list'), {'page_size': 3})
+        first_page = [p.pk for p in response.context['products']]
+        self.assertEqual(first_page, expected[:3])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('shopapp:products_list'),
+                {'page_size': 3, 'after': first_page[-1]}
+            )
+        self.assertEqual([p.pk for p in response.context['products']], expected[3:6])
+        self.assertIsNone(response.context['page_obj'])
+
 
 class OrdersListViewTestCase(TestCase):
 
@@ -119,7 +160,7 @@ class ProductsExportViewTestCase(TestCase):
             reverse('shopapp:products-export')
         )
         self.assertEqual(response.status_code, 200)
-        products = Product.objects.order_by('pk').all()
+        products = Product.active.order_by('pk').all()
         expected_data = [
             {
                 'pk': product.pk,
@@ -129,12 +170,26 @@ class ProductsExportViewTestCase(TestCase):
             }
             for product in products
         ]
-        products_data = response.json()
+        products_data = json.loads(b''.join(response.streaming_content))
         self.assertEqual(
             products_data['products'],
             expected_data,
         )
 
+    def test_get_products_after_and_limit(self):
+        pks = list(Product.active.order_by('pk').values_list('pk', flat = True))
+        response = self.client.get(
+            reverse('shopapp:products-export'),
+            {'after': pks[1], 'limit': 3}
+        )
+        products_data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([p['pk'] for p in products_data['products']], pks[2:5])
+        self.assertEqual(products_data['last_pk'], pks[4])
+
+    def test_get_products_bad_params(self):
+        response = self.client.get(reverse('shopapp:products-export'), {'limit': 'all'})
+        self.assertEqual(response.status_code, 400)
+
 
 class OrderDetailViewTestCase(TestCase):
     fixtures = [
@@ -197,10 +252,10 @@ class OrdersExportTestCase(TestCase):
     @classmethod
     def tearDownClass(cls):
         cls.user.delete()
+        super().tearDownClass()
 
     def test_orders_export(self):
         response = self.client.get(reverse('shopapp:orders-export'))
-        print('response', response)
         self.assertEqual(response.status_code, 200)
         orders = Order.objects.order_by('pk').all()
         expected_data = [
@@ -209,12 +264,824 @@ class OrdersExportTestCase(TestCase):
                 'delivery address': order.delivery_address,
                 'promocode': order.promocode,
                 'user_id': order.user_id,
+                'items_count': order.products.count(),
+                'total_price': str(sum(p.price * (100 - p.discount) / 100 for p in order.products.all())),
                 'products': [p.pk for p in order.products.all()]
             }
             for order in orders
         ]
-        orders_data = response.json()
+        orders_data = json.loads(b''.join(response.streaming_content))
         self.assertEqual(
             orders_data['orders'],
             expected_data,
         )
+
+
+@override_settings(RATE_LIMITS = {'shopapp:orders-export': None})
+class OrdersExportQueryCountTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username = 'bob-staff', password = '12345', is_staff = True)
+        cls.products = Product.objects.bulk_create(
+            Product(name = f'Product {i}', created_by = cls.user) for i in range(5)
+        )
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+
+    def create_orders(self, count: int) -> None:
+        orders = Order.objects.bulk_create(
+            Order(delivery_address = f'Street {i}', user = self.user) for i in range(count)
+        )
+        Order.products.through.objects.bulk_create(
+            Order.products.through(order_id = order.pk, product_id = product.pk)
+            for order in orders
+            for product in self.products[:order.pk % 5 + 1]
+        )
+
+    def export_query_count(self) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('shopapp:orders-export'))
+            data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data['orders']), Order.objects.count())
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_depend_on_orders(self):
+        self.create_orders(10)
+        small_export_queries = self.export_query_count()
+        self.create_orders(9990)
+        self.assertEqual(self.export_query_count(), small_export_queries)
+
+
+class ProductAdminExportCSVTestCase(TestCase):
+    fixtures = [
+        'shopapp/fixtures/fixtures-product.json',
+    ]
+
+    def setUp(self) -> None:
+        self.admin = User.objects.create_superuser(username = 'admin-test', password = '12345')
+        self.client.force_login(self.admin)
+
+    def test_export_csv(self):
+        products = Product.objects.order_by('pk')
+        response = self.client.post(
+            reverse('admin:shopapp_product_changelist'),
+            {
+                'action': 'export_csv',
+                '_selected_action': [p.pk for p in products],
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['content-type'], 'text/csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:3], ['id', 'name', 'description'])
+        self.assertEqual(
+            sorted(int(row[0]) for row in rows[1:]),
+            [p.pk for p in products],
+        )
+
+
+class ExportJobTestCase(TestCase):
+    fixtures = [
+        'shopapp/fixtures/fixtures-product.json',
+    ]
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username = 'bob-staff', password = '12345', is_staff = True)
+        self.client.force_login(self.user)
+        self.exports_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(EXPORT_JOBS_ROOT = self.exports_dir.name)
+        self.settings_override.enable()
+
+    def tearDown(self) -> None:
+        self.settings_override.disable()
+        self.exports_dir.cleanup()
+
+    def test_export_job_lifecycle(self):
+        response = self.client.post(
+            reverse('shopapp:export_job_create'),
+            {'kind': ExportJob.KIND_PRODUCTS, 'format': ExportJob.FORMAT_NDJSON}
+        )
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], ExportJob.STATUS_PENDING)
+
+        call_command('run_export_jobs', once = True, stdout = StringIO())
+
+        job_data = self.client.get(status_url).json()
+        self.assertEqual(job_data['status'], ExportJob.STATUS_DONE)
+        self.assertEqual(job_data['rows_written'], Product.active.count())
+        response = self.client.get(job_data['download_url'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            [row['pk'] for row in rows],
+            list(Product.active.order_by('pk').values_list('pk', flat = True)),
+        )
+
+    def test_unknown_kind(self):
+        response = self.client.post(reverse('shopapp:export_job_create'), {'kind': 'users'})
+        self.assertEqual(response.status_code, 400)
+
+    def export_changelist(self, query_string: str) -> list:
+        admin = User.objects.create_superuser(username = 'bob-admin', password = '12345')
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('admin:shopapp_product_changelist') + '?' + query_string,
+            {'action': 'export_csv_background', 'select_across': '1', '_selected_action': [1]},
+        )
+        self.assertEqual(response.status_code, 302)
+        job = ExportJob.objects.get()
+        # nothing is resolved in the request, the worker applies the changelist filters
+        self.assertIsNone(job.pks)
+        self.assertEqual(job.changelist_query, query_string)
+
+        call_command('run_export_jobs', once = True, stdout = StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_DONE)
+        with open(os.path.join(self.exports_dir.name, job.file_name), newline = '') as file:
+            rows = list(csv.reader(file))
+        return [int(row[0]) for row in rows[1:]]
+
+    def test_select_across_keeps_the_changelist_filters(self):
+        self.assertEqual(
+            self.export_changelist('archieved__exact=1'),
+            list(Product.objects.filter(archieved = True).order_by('pk').values_list('pk', flat = True)),
+        )
+
+    def test_select_across_keeps_the_changelist_search(self):
+        self.assertEqual(
+            self.export_changelist('q=Desktop'),
+            list(Product.objects.filter(name = 'Desktop').order_by('pk').values_list('pk', flat = True)),
+        )
+
+    def test_explicit_selection_stores_pks(self):
+        admin = User.objects.create_superuser(username = 'bob-admin', password = '12345')
+        self.client.force_login(admin)
+        self.client.post(
+            reverse('admin:shopapp_product_changelist'),
+            {'action': 'export_csv_background', '_selected_action': [2, 3]},
+        )
+        job = ExportJob.objects.get()
+        self.assertEqual(sorted(job.pks), [2, 3])
+        self.assertIsNone(job.changelist_query)
+
+    def test_large_selection_is_read_in_slices(self):
+        pks = list(Product.objects.order_by('-pk').values_list('pk', flat = True))
+        job = ExportJob.objects.create(
+            kind = ExportJob.KIND_PRODUCTS,
+            format = ExportJob.FORMAT_CSV,
+            pks = pks,
+            created_by = self.user,
+        )
+        with patch('shopapp.export_jobs.EXPORT_CHUNK_SIZE', 2):
+            chunks = list(job_chunks(job))
+        rows = [row for chunk in chunks[1:] for row in chunk]
+        self.assertEqual([row[0] for row in rows], sorted(pks))
+
+    def test_stale_running_job_is_requeued(self):
+        stale = timezone.now() - datetime.timedelta(seconds = settings.EXPORT_JOB_STALE_TIMEOUT + 1)
+        abandoned = ExportJob.objects.create(
+            kind = ExportJob.KIND_PRODUCTS,
+            status = ExportJob.STATUS_RUNNING,
+            started_at = stale,
+            heartbeat_at = stale,
+            rows_written = 3,
+            created_by = self.user,
+        )
+        alive = ExportJob.objects.create(
+            kind = ExportJob.KIND_PRODUCTS,
+            status = ExportJob.STATUS_RUNNING,
+            started_at = stale,
+            heartbeat_at = timezone.now(),
+            created_by = self.user,
+        )
+
+        self.assertEqual(claim_next_job().pk, abandoned.pk)
+        alive.refresh_from_db()
+        self.assertEqual(alive.status, ExportJob.STATUS_RUNNING)
+        self.assertIsNone(claim_next_job())
+
+
+@override_settings(RATE_LIMIT_DEFAULT = None, RATE_LIMITS = {})
+class BenchmarkTestCase(TestCase):
+    def test_seed_and_benchmark(self):
+        seed_load_data(users = 5, products = 50, orders = 20)
+        report = benchmark_endpoints(repeat = 2)
+        self.assertIn('orders-export', report)
+        for stats in report.values():
+            self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+
+
+class BenchmarkASGIStaffCookieTestCase(TestCase):
+    def test_staff_user_and_session_are_removed(self):
+        with BenchmarkASGICommand.staff_cookie() as cookie:
+            session_key = cookie.split('=', 1)[1]
+            self.assertTrue(User.objects.filter(username__startswith = 'bench-admin-', is_superuser = True).exists())
+            self.assertTrue(import_module(settings.SESSION_ENGINE).SessionStore().exists(session_key))
+        self.assertFalse(User.objects.filter(username__startswith = 'bench-admin-').exists())
+        self.assertFalse(import_module(settings.SESSION_ENGINE).SessionStore().exists(session_key))
+
+
+@override_settings(RATE_LIMIT_DEFAULT = None, RATE_LIMITS = {})
+class LoadTestTestCase(LiveServerTestCase):
+    def test_load_test(self):
+        seed_load_data(users = 2, products = 10, orders = 0)
+        host, port = self.server_thread.host, self.server_thread.port
+        report = asyncio.run(load_test(host, port, reverse('shopapp:products_list'), requests = 20, concurrency = 5))
+        self.assertEqual(report['errors'], 0)
+        self.assertLessEqual(report['p50_ms'], report['p99_ms'])
+        report = asyncio.run(load_test(host, port, '/missing/', requests = 3, concurrency = 2))
+        self.assertEqual(report['errors'], 3)
+
+
+class ExplainShopQueriesTestCase(TestCase):
+    def test_no_sequential_scans(self):
+        out = StringIO()
+        call_command('explain_shop_queries', fail_on_seq_scan = True, stdout = out)
+        self.assertIn('No sequential scans', out.getvalue())
+
+
+class OrderTotalsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username = 'bob-test', password = '12345')
+        cls.laptop = Product.objects.create(name = 'Laptop', price = '100.00', discount = 10, created_by = cls.user)
+        cls.phone = Product.objects.create(name = 'Phone', price = '50.00', created_by = cls.user)
+
+    def setUp(self) -> None:
+        self.order = Order.objects.create(user = self.user)
+
+    def assertTotals(self, items_count: int, total_price: str) -> None:
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.items_count, items_count)
+        self.assertEqual(self.order.total_price, Decimal(total_price))
+
+    def test_products_added_and_removed(self):
+        self.order.products.add(self.laptop, self.phone)
+        self.assertTotals(2, '140.00')
+        self.order.products.remove(self.phone)
+        self.assertTotals(1, '90.00')
+        self.order.products.clear()
+        self.assertTotals(0, '0')
+
+    def test_reverse_relation(self):
+        self.phone.orders.add(self.order)
+        self.assertTotals(1, '50.00')
+        self.phone.orders.clear()
+        self.assertTotals(0, '0')
+
+    def test_product_price_changed(self):
+        self.order.products.add(self.laptop)
+        self.laptop.price = Decimal('200.00')
+        self.laptop.save()
+        self.assertTotals(1, '180.00')
+
+    def test_product_saved_with_the_same_prices(self):
+        self.order.products.add(self.laptop)
+        updated_at = Order.objects.values_list('updated_at', flat = True).get(pk = self.order.pk)
+        self.laptop.name = 'Laptop Pro'
+        self.laptop.price = '100.00'
+        with CaptureQueriesContext(connection) as context:
+            self.laptop.save()
+        self.assertFalse([query for query in context.captured_queries if 'shopapp_order' in query['sql']])
+        self.assertEqual(Order.objects.values_list('updated_at', flat = True).get(pk = self.order.pk), updated_at)
+
+    def test_backfill(self):
+        self.order.products.add(self.laptop, self.phone)
+        Order.objects.update(items_count = 0, total_price = 0)
+        call_command('backfill_order_totals', batch_size = 1, stdout = StringIO())
+        self.assertTotals(2, '140.00')
+
+
+class OrderTotalsMigrationTestCase(TransactionTestCase):
+    migrate_from = [('shopapp', '0010_product_order_indexes')]
+    migrate_to = [('shopapp', '0011_order_items_count_total_price')]
+
+    def tearDown(self) -> None:
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_existing_orders_get_their_totals(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        apps = executor.loader.project_state(self.migrate_from).apps
+        user = apps.get_model('auth', 'User').objects.create(username = 'bob-test')
+        product = apps.get_model('shopapp', 'Product').objects.create(
+            name = 'Laptop', price = '100.00', discount = 10, created_by_id = user.pk,
+        )
+        order = apps.get_model('shopapp', 'Order').objects.create(user_id = user.pk)
+        order.products.add(product)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        apps = executor.loader.project_state(self.migrate_to).apps
+        order = apps.get_model('shopapp', 'Order').objects.get(pk = order.pk)
+        self.assertEqual(order.items_count, 1)
+        self.assertEqual(order.total_price, Decimal('90.00'))
+
+
+class ImportProductsCommandTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username = 'bob-test', password = '12345')
+        self.product = Product.objects.create(name = 'Laptop', price = '100.00', created_by = self.user)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'products.ndjson')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_import_products(self):
+        rows = [
+            {'name': 'Chair', 'price': '19.99', 'discount': 0},
+            {'name': 'Broken', 'price': 'free', 'discount': 0},
+            {'id': self.product.pk, 'name': 'Laptop Pro', 'price': '150.00', 'discount': 5},
+        ]
+        with open(self.path, 'w') as file:
+            file.writelines(json.dumps(row) + '\n' for row in rows)
+
+        call_command('import_products', self.path, created_by = 'bob-test', batch_size = 2, stdout = StringIO())
+
+        self.assertTrue(Product.objects.filter(name = 'Chair', created_by = self.user).exists())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.discount), ('Laptop Pro', 5))
+        with open(self.path + '.rejects.ndjson') as rejects:
+            rejected = [json.loads(line) for line in rejects]
+        self.assertEqual([row['line'] for row in rejected], [2])
+        self.assertIn('price', rejected[0]['errors'])
+
+
+class UpdateOrderCommandTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username = 'bob-test', password = '12345')
+        cls.products = Product.objects.bulk_create(
+            Product(name = f'Product {i}', price = 10, created_by = cls.user) for i in range(7)
+        )
+        cls.orders = [Order.objects.create(user = cls.user) for _ in range(3)]
+
+    def test_default_adds_all_products_to_first_order(self):
+        call_command('update_order', stdout = StringIO())
+        self.assertEqual(self.orders[0].products.count(), 7)
+        self.assertEqual(self.orders[1].products.count(), 0)
+
+    def test_add_remove_in_batches(self):
+        self.orders[0].products.add(self.products[0])
+        call_command('update_order', all_orders = True, batch_size = 4, stdout = StringIO())
+        self.assertEqual(Order.products.through.objects.count(), 21)
+        self.orders[2].refresh_from_db()
+        self.assertEqual(self.orders[2].items_count, 7)
+
+        call_command(
+            'update_order',
+            order_ids = [self.orders[1].pk],
+            product_ids = [p.pk for p in self.products[:3]],
+            remove = True,
+            stdout = StringIO(),
+        )
+        self.assertEqual(self.orders[1].products.count(), 4)
+
+    def test_product_chunks_stay_large(self):
+        with patch('shopapp.management.commands.update_order.MIN_PRODUCT_CHUNK', 4):
+            with CaptureQueriesContext(connection) as context:
+                call_command('update_order', all_orders = True, batch_size = 8, stdout = StringIO())
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        # two orders with 4 and 3 products, then the last order with all 7
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Order.products.through.objects.count(), 21)
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('update_order', all_orders = True, dry_run = True, stdout = out)
+        self.assertIn('Would add 21', out.getvalue())
+        self.assertFalse(Order.products.through.objects.exists())
+
+
+class SeedLoadDataTestCase(TestCase):
+    def test_seed_load_data(self):
+        counts = seed_load_data(users = 10, products = 200, orders = 100, batch_size = 30, seed = 7)
+        self.assertEqual(counts['users'], 10)
+        self.assertEqual(Profile.objects.filter(user__username__startswith = 'load-user-').count(), 10)
+        self.assertEqual(Product.objects.count(), 200)
+        self.assertEqual(Order.objects.count(), 100)
+        self.assertEqual(Order.products.through.objects.count(), counts['order_products'])
+        self.assertFalse(Order.objects.filter(items_count = 0).exists())
+        first_run = self.generated_links()
+
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+        User.objects.all().delete()
+        seed_load_data(users = 10, products = 200, orders = 100, batch_size = 30, seed = 7)
+        self.assertEqual(self.generated_links(), first_run)
+
+    @staticmethod
+    def generated_links() -> list:
+        return list(
+            Order.products.through.objects
+            .order_by('order_id', 'product__name')
+            .values_list('order__delivery_address', 'order__user__username', 'product__name')
+        )
+
+    def test_command_refuses_existing_prefix(self):
+        User.objects.create_user(username = 'load-user-0')
+        with self.assertRaises(CommandError):
+            call_command('seed_load_data', users = 1, products = 1, orders = 1, stdout = StringIO())
+
+
+@override_settings(
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shop': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shop'},
+        'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'},
+        'permissions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'permissions'},
+    },
+    RATE_LIMIT_DEFAULT = None,
+)
+class ProductFragmentCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        caches['shop'].clear()
+        self.user = User.objects.create_user(username = 'bob-test', password = '12345')
+        self.product = Product.objects.create(name = 'Laptop', price = '100.00', created_by = self.user)
+
+    def test_products_list_is_cached_until_product_changes(self):
+        url = reverse('shopapp:products_list')
+        self.assertContains(self.client.get(url), 'Laptop')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertFalse(any('shopapp_product' in query['sql'] and 'LIMIT' in query['sql']
+                             for query in context.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute = True):
+            self.product.name = 'Desktop'
+            self.product.save()
+        self.assertContains(self.client.get(url), 'Desktop')
+
+    def test_generation_changes_on_commit_only(self):
+        generation = get_catalogue_generation()
+        with self.captureOnCommitCallbacks(execute = True):
+            self.product.save()
+            self.assertEqual(get_catalogue_generation(), generation)
+        self.assertNotEqual(get_catalogue_generation(), generation)
+
+    def test_culled_generation_is_not_reused(self):
+        generation = get_catalogue_generation()
+        caches['shop'].delete(CATALOGUE_GENERATION_KEY)
+        self.assertNotEqual(get_catalogue_generation(), generation)
+
+    def test_admin_archive_action_invalidates_list(self):
+        url = reverse('shopapp:products_list')
+        self.assertContains(self.client.get(url), 'Laptop')
+        self.client.force_login(User.objects.create_superuser(username = 'admin-test', password = '12345'))
+        with self.captureOnCommitCallbacks(execute = True):
+            self.client.post(
+                reverse('admin:shopapp_product_changelist'),
+                {'action': 'mark_archieved', '_selected_action': [self.product.pk]},
+            )
+        self.assertNotContains(self.client.get(url), 'Laptop')
+
+    def test_product_details_fragment(self):
+        url = reverse('shopapp:product_details', kwargs = {'pk': self.product.pk})
+        self.assertContains(self.client.get(url), 'Laptop')
+        Product.objects.filter(pk = self.product.pk).update(price = '120.00')
+        self.assertContains(self.client.get(url), '120.00')
+
+
+@override_settings(RATE_LIMIT_DEFAULT = None)
+class ConditionalGetTestCase(TestCase):
+    def setUp(self) -> None:
+        caches['shop'].clear()
+        self.user = User.objects.create_user(username = 'bob-test', password = '12345')
+        self.product = Product.objects.create(name = 'Laptop', price = '100.00', created_by = self.user)
+
+    def test_products_list_not_modified_until_product_changes(self):
+        url = reverse('shopapp:products_list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.product.name = 'Desktop'
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_order_details_not_modified_until_products_change(self):
+        self.client.force_login(self.user)
+        self.user.user_permissions.add(Permission.objects.get(codename = 'view_order'))
+        order = Order.objects.create(delivery_address = 'Test street', user = self.user)
+        url = reverse('shopapp:order_details', kwargs = {'pk': order.pk})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH = etag).status_code, 304)
+
+        order.products.add(self.product)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH = etag).status_code, 200)
+
+    def test_product_details_modified_when_permissions_change(self):
+        self.client.force_login(self.user)
+        url = reverse('shopapp:product_details', kwargs = {'pk': self.product.pk})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH = etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute = True):
+            self.user.user_permissions.add(Permission.objects.get(codename = 'change_product'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('shopapp:product_update', kwargs = {'pk': self.product.pk}))
+
+
+@override_settings(RATE_LIMIT_DEFAULT = None)
+class ProductSoftDeleteTestCase(TestCase):
+    def setUp(self) -> None:
+        caches['shop'].clear()
+        self.user = User.objects.create_user(username = 'bob-test', password = '12345')
+        self.laptop = Product.objects.create(name = 'Laptop', created_by = self.user)
+        self.phone = Product.objects.create(name = 'Phone', created_by = self.user, archieved = True)
+
+    def test_managers(self):
+        self.assertQuerysetEqual(Product.active.all(), [self.laptop])
+        self.assertQuerysetEqual(Product.objects.archived(), [self.phone])
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_archive_is_single_update(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(Product.objects.filter(pk = self.laptop.pk).archive(), 1)
+        self.assertFalse(Product.active.exists())
+        Product.objects.archived().unarchive()
+        self.assertEqual(Product.active.count(), 2)
+
+    def test_delete_view_archives_product(self):
+        url = reverse('shopapp:products_list')
+        self.assertContains(self.client.get(url), 'Laptop')
+        with self.captureOnCommitCallbacks(execute = True):
+            response = self.client.post(reverse('shopapp:product_delete', kwargs = {'pk': self.laptop.pk}))
+        self.assertRedirects(response, url)
+        self.assertTrue(Product.objects.get(pk = self.laptop.pk).archieved)
+        self.assertNotContains(self.client.get(url), 'Laptop')
+        products_data = json.loads(b''.join(self.client.get(reverse('shopapp:products-export')).streaming_content))
+        self.assertEqual(products_data['products'], [])
+
+
+@override_settings(RATE_LIMIT_DEFAULT = None)
+class ProductSearchTestCase(TestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username = 'bob-test', password = '12345')
+        self.laptop = Product.objects.create(
+            name = 'Gaming laptop', description = 'Fast notebook', price = '100.00', created_by = self.user
+        )
+        self.bag = Product.objects.create(
+            name = 'Bag', description = 'Fits a 15" laptop', price = '10.00', created_by = self.user
+        )
+        Product.objects.create(name = 'Old laptop', archieved = True, created_by = self.user)
+
+    def search(self, query: str) -> list:
+        response = self.client.get(reverse('shopapp:products_search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['products'])
+
+    def test_ranked_substring_search(self):
+        self.assertEqual(self.search('lapt'), [self.laptop, self.bag])
+        self.assertEqual(self.search('LAPTOP notebook'), [self.laptop])
+        self.assertEqual(self.search('15" lap'), [self.bag])
+        self.assertEqual(self.search('phone'), [])
+
+    def test_index_follows_changes(self):
+        self.laptop.name = 'Gaming desktop'
+        self.laptop.description = ''
+        self.laptop.save()
+        self.assertEqual(self.search('laptop'), [self.bag])
+        self.bag.delete()
+        self.assertEqual(self.search('laptop'), [])
+        self.assertEqual(self.search('desk'), [self.laptop])
+
+    def test_rebuild_command(self):
+        Product.objects.bulk_create([Product(name = 'Laptop stand', created_by = self.user)])
+        self.assertEqual(len(self.search('stand')), 0)
+        call_command('rebuild_product_search', stdout = StringIO())
+        self.assertEqual(len(self.search('stand')), 1)
+
+    def test_admin_search(self):
+        self.client.force_login(User.objects.create_superuser(username = 'admin-test', password = '12345'))
+        response = self.client.get(reverse('admin:shopapp_product_changelist'), {'q': 'laptop'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(reverse('admin:shopapp_product_changelist'), {'q': 'gaming'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+@override_settings(RATE_LIMIT_DEFAULT = None)
+class AsyncViewsTestCase(TestCase):
+    fixtures = ['shopapp/fixtures/fixtures-for-orders-export.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username = 'bob-staff', password = '12345', is_staff = True)
+
+    @staticmethod
+    async def read_json(response) -> dict:
+        return json.loads(b''.join([part async for part in response.streaming_content]))
+
+    async def test_products_list_pages(self):
+        expected = [pk async for pk in Product.active.order_by('name', 'pk').values_list('pk', flat = True)]
+        response = await self.async_client.get(reverse('shopapp:async_products_list'), {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p.pk for p in response.context['products']], expected[:2])
+        response = await self.async_client.get(
+            reverse('shopapp:async_products_list'),
+            {'page_size': 2, 'after': response.context['next_after']}
+        )
+        self.assertEqual([p.pk for p in response.context['products']], expected[2:4])
+
+    async def test_product_details(self):
+        product = await Product.objects.afirst()
+        response = await self.async_client.get(reverse('shopapp:async_product_details', kwargs = {'pk': product.pk}))
+        self.assertContains(response, product.name)
+        # the metrics middleware runs in async mode and still sees the queries
+        self.assertNotIn('"0 queries"', response['Server-Timing'])
+        response = await self.async_client.get(reverse('shopapp:async_product_details', kwargs = {'pk': 10 ** 6}))
+        self.assertEqual(response.status_code, 404)
+
+    def sync_export(self, url: str, params: dict) -> dict:
+        return json.loads(b''.join(self.client.get(url, params).streaming_content))
+
+    async def test_exports_match_sync_views(self):
+        await sync_to_async(self.client.force_login)(self.staff)
+        self.async_client.cookies = self.client.cookies
+        for sync_name, async_name in (('shopapp:products-export', 'shopapp:async_products_export'),
+                                      ('shopapp:orders-export', 'shopapp:async_orders_export')):
+            async_response = await self.async_client.get(reverse(async_name), {'after': 1, 'limit': 3})
+            self.assertEqual(
+                await self.read_json(async_response),
+                await sync_to_async(self.sync_export)(reverse(sync_name), {'after': 1, 'limit': 3}),
+            )
+
+    async def test_orders_export_is_staff_only(self):
+        url = reverse('shopapp:async_orders_export')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 302)
+        user = await User.objects.acreate(username = 'bob-test')
+        await sync_to_async(self.client.force_login)(user)
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(RATE_LIMIT_DEFAULT = None)
+class AdminChangelistTestCase(TestCase):
+    def setUp(self) -> None:
+        caches['shop'].clear()
+        self.admin = User.objects.create_superuser(username = 'admin-test', password = '12345')
+        self.client.force_login(self.admin)
+        self.product = Product.objects.create(name = 'Laptop', description = 'x' * 1000, created_by = self.admin)
+        order = Order.objects.create(delivery_address = 'Test street', user = self.admin)
+        order.products.add(self.product)
+
+    def test_product_changelist_does_not_load_descriptions(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:shopapp_product_changelist'))
+        self.assertContains(response, 'x' * 50 + '...')
+        selects = [query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue([sql for sql in selects if 'SUBSTR("shopapp_product"."description"' in sql])
+        self.assertFalse([sql for sql in selects if ', "shopapp_product"."description"' in sql])
+
+    def test_estimated_count(self):
+        caches['shop'].set('shopapp:row-count:shopapp_product', 123456)
+        response = self.client.get(reverse('admin:shopapp_product_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 123456)
+        response = self.client.get(reverse('admin:shopapp_product_changelist'), {'archieved__exact': '0'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_order_pages_do_not_load_all_products(self):
+        order = Order.objects.get()
+        for url in (
+            reverse('admin:shopapp_order_changelist'),
+            reverse('admin:shopapp_order_change', args = [order.pk]),
+            reverse('admin:shopapp_order_delete', args = [order.pk]),
+        ):
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            # only the paginated inline reads the links, one page at a time
+            self.assertFalse([
+                query for query in context.captured_queries
+                if 'INNER JOIN "shopapp_order_products"' in query['sql'] and 'LIMIT' not in query['sql']
+            ])
+
+
+@override_settings(RATE_LIMIT_DEFAULT = None)
+class AdminAutocompleteTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username = 'admin-test', password = '12345')
+        cls.buyer = User.objects.create_user(username = 'bob-buyer')
+        cls.products = Product.objects.bulk_create(
+            Product(name = f'Product {i:03}', price = 1, created_by = cls.admin) for i in range(120)
+        )
+        reindex_products()
+        cls.order = Order.objects.create(delivery_address = 'Test street', user = cls.buyer)
+        cls.order.products.add(*cls.products[:110])
+
+    def setUp(self) -> None:
+        self.client.force_login(self.admin)
+
+    def autocomplete(self, model_name: str, field_name: str, term: str) -> list:
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'shopapp', 'model_name': model_name, 'field_name': field_name, 'term': term,
+        })
+        self.assertEqual(response.status_code, 200)
+        return [result['text'] for result in response.json()['results']]
+
+    def test_autocomplete_endpoints(self):
+        self.assertEqual(self.autocomplete('order', 'user', 'bob'), ['bob-buyer'])
+        self.assertEqual(self.autocomplete('order_products', 'product', 'Product 119'),
+                         [str(self.products[119])])
+        self.assertEqual(self.autocomplete('order_products', 'order', str(self.order.pk)), [str(self.order)])
+
+    def test_autocomplete_pages_are_ordered(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            self.assertEqual(self.autocomplete('order_products', 'order', ''), [str(self.order)])
+
+    def test_change_page_renders_one_page_of_inline_rows(self):
+        url = reverse('admin:shopapp_order_change', args = [self.order.pk])
+        response = self.client.get(url)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(formset.initial_form_count(), 50)
+        self.assertNotContains(response, '<option value="%s"' % self.products[119].pk)
+        response = self.client.get(url, {f'{formset.prefix}-page': 3})
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), 10)
+
+    def test_inline_changes_update_totals(self):
+        order = Order.objects.create(delivery_address = 'Other street', user = self.buyer)
+        prefix = 'Order_products'
+        response = self.client.post(reverse('admin:shopapp_order_change', args = [order.pk]), {
+            'delivery_address': order.delivery_address,
+            'promocode': '',
+            'user': self.buyer.pk,
+            f'{prefix}-TOTAL_FORMS': 1,
+            f'{prefix}-INITIAL_FORMS': 0,
+            f'{prefix}-0-product': self.products[0].pk,
+            f'{prefix}-0-order': order.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual(order.items_count, 1)
+        self.assertEqual(order.total_price, 1)
+
+
+class OrderPickerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username = 'picker-test', password = '12345')
+        cls.products = Product.objects.bulk_create(
+            Product(name = f'Picker {i:03}', price = 1, created_by = cls.user) for i in range(30)
+        )
+        Product.objects.create(name = 'Picker archived', price = 1, archieved = True, created_by = cls.user)
+        cls.order = Order.objects.create(delivery_address = 'Test street', user = cls.user)
+        cls.order.products.add(cls.products[5])
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+
+    def test_products_picker_pages_by_prefix(self):
+        url = reverse('shopapp:products_picker')
+        data = self.client.get(url, {'q': 'Picker 01'}).json()
+        self.assertEqual([result['id'] for result in data['results']], [p.pk for p in self.products[10:20]])
+        self.assertIsNone(data['next_after'])
+        data = self.client.get(url, {'q': 'Picker', 'page_size': 25}).json()
+        self.assertEqual(len(data['results']), 25)
+        data = self.client.get(url, {'q': 'Picker', 'page_size': 25, 'after': data['next_after']}).json()
+        self.assertEqual([result['text'] for result in data['results']], [str(p) for p in self.products[25:]])
+        self.assertIsNone(data['next_after'])
+
+    def test_users_picker(self):
+        data = self.client.get(reverse('shopapp:users_picker'), {'q': 'picker-'}).json()
+        self.assertEqual(data['results'], [{'id': self.user.pk, 'text': 'picker-test'}])
+
+    def test_pickers_require_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('shopapp:users_picker'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_order_form_renders_only_selected_options(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shopapp:order_update', kwargs = {'pk': self.order.pk}))
+        self.assertContains(response, 'data-picker-url="%s"' % reverse('shopapp:products_picker'))
+        self.assertContains(response, '<option value="%s" selected>' % self.products[5].pk)
+        self.assertNotContains(response, '<option value="%s"' % self.products[6].pk)
+        # no unfiltered SELECT over the catalogue or the users
+        self.assertFalse([q for q in queries if 'FROM "shopapp_product"' in q['sql'] and 'WHERE' not in q['sql']])
+        self.assertFalse([q for q in queries if 'FROM "auth_user"' in q['sql'] and 'WHERE' not in q['sql']])
+
+    def test_order_form_accepts_picked_products(self):
+        response = self.client.post(reverse('shopapp:create_order'), {
+            'user': self.user.pk,
+            'products': [self.products[1].pk, self.products[2].pk],
+            'delivery_address': 'New street',
+            'promocode': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get(delivery_address = 'New street')
+        self.assertEqual(set(order.products.values_list('pk', flat = True)), {self.products[1].pk, self.products[2].pk})
@@ -1,12 +1,20 @@
 # coding=utf-8
 from django.urls import path
 
+from .async_views import (AsyncOrdersExportDataView,
+                          AsyncProductDetailsView,
+                          AsyncProductsExportDataView,
+                          AsyncProductsListView,
+                          )
 from .views import (ShopIndexView,
                     GroupsListView,
                     OrdersListView,
                     OrderCreateView,
                     ProductDetailsView,
                     ProductsListView,
+                    ProductSearchView,
+                    ProductPickerView,
+                    UserPickerView,
                     OrderDetailView,
                     ProductCreateView,
                     ProductUpdateView,
@@ -15,6 +23,9 @@ from .views import (ShopIndexView,
                     OrderDeleteView,
                     ProductsExportDataView,
                     OrdersExportDataView,
+                    ExportJobCreateView,
+                    ExportJobDetailView,
+                    ExportJobDownloadView,
                     )
 
 app_name = 'shopapp'
@@ -23,6 +34,8 @@ urlpatterns = [
     path('', ShopIndexView.as_view(), name = 'index'),
     path('groups/', GroupsListView.as_view(), name = 'groups_list'),
     path('products/', ProductsListView.as_view(), name = 'products_list'),
+    path('products/search/', ProductSearchView.as_view(), name = 'products_search'),
+    path('products/picker/', ProductPickerView.as_view(), name = 'products_picker'),
     path('products/create/', ProductCreateView.as_view(), name = 'create_product'),
     path('products/export/', ProductsExportDataView.as_view(), name='products-export'),
     path('products/<int:pk>/', ProductDetailsView.as_view(), name = 'product_details'),
@@ -34,5 +47,13 @@ urlpatterns = [
     path('orders/<int:pk>/', OrderDetailView.as_view(), name = 'order_details'),
     path('orders/<int:pk>/update/', OrderUpdateView.as_view(), name = 'order_update'),
     path('orders/<int:pk>/delete/', OrderDeleteView.as_view(), name = 'order_delete'),
+    path('users/picker/', UserPickerView.as_view(), name = 'users_picker'),
+    path('exports/', ExportJobCreateView.as_view(), name = 'export_job_create'),
+    path('exports/<int:pk>/', ExportJobDetailView.as_view(), name = 'export_job'),
+    path('exports/<int:pk>/download/', ExportJobDownloadView.as_view(), name = 'export_job_download'),
+    path('async/products/', AsyncProductsListView.as_view(), name = 'async_products_list'),
+    path('async/products/export/', AsyncProductsExportDataView.as_view(), name = 'async_products_export'),
+    path('async/products/<int:pk>/', AsyncProductDetailsView.as_view(), name = 'async_product_details'),
+    path('async/orders/export/', AsyncOrdersExportDataView.as_view(), name = 'async_orders_export'),
 
 ]
@@ -2,16 +2,39 @@
 import json
 from timeit import default_timer
 
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import Group, User
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.db.models import Count, Max, QuerySet
+from django.http import (FileResponse,
+                         Http404,
+                         HttpRequest,
+                         HttpResponse,
+                         HttpResponseBadRequest,
+                         HttpResponseRedirect,
+                         JsonResponse,
+                         StreamingHttpResponse,
+                         )
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.http import urlencode
 from django.views import View
 from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
 
-from shopapp.models import Product, Order
+from shopapp.models import Product, Order, ExportJob
+from .cache import get_catalogue_generation
+from .conditional import ConditionalGetMixin
+from .export_jobs import get_export_storage
+from .exporters import (ExportParamsError,
+                        chunked,
+                        get_export_params,
+                        order_export_rows,
+                        product_export_chunks,
+                        stream_json_list,
+                        )
 from .forms import ProductForm, OrderForm, GroupForm
+from .pagination import KeysetPaginationMixin
+from .search import indexed_prefix, search_products
 
 
 class ShopIndexView(View):
@@ -43,17 +66,72 @@ class GroupsListView(View):
         return redirect(request.path)
 
 
-class ProductDetailsView(DetailView):
+def product_permissions(user: User, product: Product) -> dict:
+    owner = user.is_superuser or user.id == product.created_by_id
+    return {
+        'can_change': owner and (user.is_superuser or user.has_perm('shopapp.change_product')),
+        'can_delete': owner and (user.is_superuser or user.has_perm('shopapp.delete_product')),
+    }
+
+
+class ProductDetailsView(ConditionalGetMixin, DetailView):
     template_name = 'shopapp/product-details.html'
     model = Product
     context_object_name = 'product'
 
+    def get_validators(self):
+        updated_at = Product.objects.filter(pk = self.kwargs['pk']).values_list('updated_at', flat = True).first()
+        return updated_at, []
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(product_permissions(self.request.user, self.object))
+        context['fragment_cache_timeout'] = settings.SHOP_FRAGMENT_CACHE_TIMEOUT
+        return context
 
-class ProductsListView(ListView):
+
+class ProductsListView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
     template_name = 'shopapp/products_list.html'
     # model = Product
     context_object_name = 'products'
-    queryset = Product.objects.filter(archieved = False)
+    queryset = Product.active.all()
+    keyset_ordering = ('name', 'pk')
+
+    def get_validators(self):
+        if 'after' in self.request.GET:
+            # keyset pages skip COUNT(*), so they are not validated either
+            return None
+        state = Product.active.aggregate(last = Max('updated_at'), count = Count('pk'))
+        return state['last'], [state['count']]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user = self.request.user
+        context['catalogue_generation'] = get_catalogue_generation()
+        context['can_view_product'] = user.is_superuser or user.has_perm('shopapp.view_product')
+        context['fragment_cache_timeout'] = settings.SHOP_FRAGMENT_CACHE_TIMEOUT
+        return context
+
+
+class ProductSearchView(ListView):
+    """
+    Products matching every word of ?q= in the name or description, best matches first
+    """
+
+    template_name = 'shopapp/products_search.html'
+    context_object_name = 'products'
+    paginate_by = 20
+
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '').strip()
+        return search_products(Product.active.all(), self.query)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.query
+        context['page_size'] = self.paginate_by
+        context['pagination_query'] = '&' + urlencode({'q': self.query})
+        return context
 
 
 class ProductCreateView(CreateView):  # ��� ������������ ����������� PermissionRequiredMixin
@@ -95,29 +173,79 @@ class ProductDeleteView(DeleteView):
 
     def form_valid(self, form):
         success_url = self.get_success_url()
-        self.object.archieved = True
-        self.object.save()
+        Product.objects.filter(pk = self.object.pk).archive()
         return HttpResponseRedirect(success_url)
 
 
+class PickerView(LoginRequiredMixin, KeysetPaginationMixin, View):
+    """
+    Options for the picker widgets as JSON: {"results": [{"id": ..., "text": ...}], "next_after": <pk>}.
+    ?q= matches the start of `search_field`, ?after=<next_after> gets the next page,
+    so every request is one index range scan whatever the size of the table.
+    """
+
+    queryset = None
+    search_field = None
+
+    def get_queryset(self) -> QuerySet:
+        queryset = self.queryset.only('pk', self.search_field)
+        prefix = self.request.GET.get('q', '').strip()
+        if prefix:
+            queryset = queryset.filter(indexed_prefix(self.search_field, prefix))
+        return queryset
+
+    def get(self, request: HttpRequest) -> JsonResponse:
+        objects = self.keyset_page(self.get_queryset(), self.get_paginate_by(None))
+        return JsonResponse({
+            'results': [{'id': obj.pk, 'text': str(obj)} for obj in objects],
+            'next_after': self.next_after,
+        })
+
+
+class ProductPickerView(PickerView):
+    queryset = Product.active.all()
+    search_field = 'name'
+    keyset_ordering = ('name', 'pk')
+
+
+class UserPickerView(PickerView):
+    queryset = User.objects.all()
+    search_field = 'username'
+    keyset_ordering = ('username', 'pk')
+
+
 class OrderCreateView(CreateView):
     model = Order
-    fields = 'user', 'products', 'promocode', 'delivery_address'
+    form_class = OrderForm
     success_url = reverse_lazy('shopapp:orders_list')
 
 
-class OrdersListView(LoginRequiredMixin, ListView):
-    queryset = Order.objects.select_related('user').prefetch_related('products')
+class OrdersListView(LoginRequiredMixin, ConditionalGetMixin, KeysetPaginationMixin, ListView):
+    queryset = Order.objects.select_related('user')
+
+    def get_validators(self):
+        if 'after' in self.request.GET:
+            return None
+        state = Order.objects.aggregate(last = Max('updated_at'), count = Count('pk'))
+        return state['last'], [state['count']]
 
 
-class OrderDetailView(PermissionRequiredMixin, DetailView):  # закомментировал для тестов, не смог обойти
+class OrderDetailView(PermissionRequiredMixin, ConditionalGetMixin, DetailView):  # закомментировал для тестов, не смог обойти
     permission_required = 'shopapp.view_order'
     queryset = Order.objects.select_related('user').prefetch_related('products')
 
+    def get_validators(self):
+        # the page also shows the names and prices of the products
+        state = Order.objects.filter(pk = self.kwargs['pk']).aggregate(
+            order = Max('updated_at'),
+            products = Max('products__updated_at'),
+        )
+        return max(filter(None, state.values()), default = None), []
+
 
 class OrderUpdateView(UpdateView):
     model = Order
-    fields = 'user', 'products', 'promocode', 'delivery_address'
+    form_class = OrderForm
     template_name_suffix = '_update_form'
 
     def get_success_url(self):
@@ -132,42 +260,103 @@ class OrderDeleteView(DeleteView):
     success_url = reverse_lazy('shopapp:orders_list')
 
 
-class ProductsExportDataView(View):
-    def get(self, request: HttpRequest) -> JsonResponse:
-        products = Product.objects.order_by('pk').all()
-        products_data = [
-            {
-                'pk': product.pk,
-                'name': product.name,
-                'price': product.price,
-                'archieved': product.archieved
-            }
-            for product in products
-        ]
-        return JsonResponse({'products': products_data})
+class ProductsExportDataView(ConditionalGetMixin, View):
+    """
+    Streams the products that are not archived as JSON in pk order.
+    Use ?after=<pk>&limit=<n> to pull the catalogue in resumable pages.
+    """
 
+    def get_validators(self):
+        state = Product.active.aggregate(last = Max('updated_at'), count = Count('pk'))
+        return state['last'], [state['count']]
 
-class OrdersExportDataView(UserPassesTestMixin, View):
-    def get(self, request: HttpRequest) -> JsonResponse:
-        if self.request.user.is_staff:
-            orders = Order.objects.order_by('pk').all()
-            print('orders', orders)
-            orders_data = [
-                {
-                    'pk': order.pk,
-                    'delivery address': order.delivery_address,
-                    'promocode': order.promocode,
-                    'user_id': order.user_id,
-                    'products': [p.pk for p in order.products.all()]
-                }
-                for order in orders
-            ]
-            print('orders-data', orders_data)
-            return JsonResponse({'orders': orders_data})
-        print('У вас недостаточно прав для просмотра этой страницы')
-        return JsonResponse({'rules', 'У вас недостаточно прав для просмотра этой страницы'})
+    def get(self, request: HttpRequest) -> HttpResponse:
+        try:
+            after, limit = get_export_params(request)
+        except ExportParamsError as e:
+            return HttpResponseBadRequest(str(e))
+        chunks = product_export_chunks(after = after, limit = limit)
+        return StreamingHttpResponse(
+            stream_json_list('products', chunks),
+            content_type = 'application/json'
+        )
+
+
+class OrdersExportDataView(UserPassesTestMixin, ConditionalGetMixin, View):
+    """
+    Streams orders with their product pks as JSON.
+    Accepts the same ?after=<pk>&limit=<n> as the products export.
+    """
+
+    def get_validators(self):
+        # product pks are exported by name order, so renaming a product changes the export
+        state = Order.objects.aggregate(last = Max('updated_at'), count = Count('pk'))
+        products_state = Product.objects.aggregate(last = Max('updated_at'))
+        return state['last'], [state['count'], products_state['last']]
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        try:
+            after, limit = get_export_params(request)
+        except ExportParamsError as e:
+            return HttpResponseBadRequest(str(e))
+        rows = order_export_rows(after = after, limit = limit)
+        return StreamingHttpResponse(
+            stream_json_list('orders', chunked(rows)),
+            content_type = 'application/json'
+        )
 
     def test_func(self):
-        if self.request.user.is_staff:
-            return True
-        return False
+        return self.request.user.is_staff
+
+
+class ExportJobMixin(UserPassesTestMixin):
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_job(self, pk: int) -> ExportJob:
+        return get_object_or_404(ExportJob, pk = pk, created_by = self.request.user)
+
+    def job_data(self, job: ExportJob) -> dict:
+        data = {
+            'pk': job.pk,
+            'kind': job.kind,
+            'format': job.format,
+            'status': job.status,
+            'rows_written': job.rows_written,
+            'error': job.error,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+            'status_url': reverse('shopapp:export_job', kwargs = {'pk': job.pk}),
+        }
+        if job.status == ExportJob.STATUS_DONE:
+            data['download_url'] = reverse('shopapp:export_job_download', kwargs = {'pk': job.pk})
+        return data
+
+
+class ExportJobCreateView(ExportJobMixin, View):
+    """
+    Queues an export for the run_export_jobs worker instead of running it in the request
+    """
+
+    def post(self, request: HttpRequest) -> JsonResponse:
+        kind = request.POST.get('kind')
+        export_format = request.POST.get('format', ExportJob.FORMAT_JSON)
+        if kind not in dict(ExportJob.KIND_CHOICES) or export_format not in dict(ExportJob.FORMAT_CHOICES):
+            return JsonResponse({'error': 'Unknown export kind or format'}, status = 400)
+        job = ExportJob.objects.create(kind = kind, format = export_format, created_by = request.user)
+        return JsonResponse(self.job_data(job), status = 202)
+
+
+class ExportJobDetailView(ExportJobMixin, View):
+    def get(self, request: HttpRequest, pk: int) -> JsonResponse:
+        return JsonResponse(self.job_data(self.get_job(pk)))
+
+
+class ExportJobDownloadView(ExportJobMixin, View):
+    def get(self, request: HttpRequest, pk: int) -> FileResponse:
+        job = self.get_job(pk)
+        storage = get_export_storage()
+        if job.status != ExportJob.STATUS_DONE or not storage.exists(job.file_name):
+            raise Http404('Export file is not ready')
+        return FileResponse(storage.open(job.file_name), as_attachment = True, filename = job.file_name)
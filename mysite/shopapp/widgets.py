@@ -0,0 +1,54 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+
+
+class PickerMixin:
+    """
+    Select widget for model choice fields over large tables. The page only gets
+    <option>s for the selected values, fetched with one pk__in query instead of
+    iterating the whole queryset; picker.js loads the rest from the JSON picker
+    view named by `url_name` as the user types.
+    """
+
+    def __init__(self, url_name: str, attrs = None):
+        super().__init__(attrs)
+        self.url_name = url_name
+
+    class Media:
+        js = ('shopapp/picker.js',)
+
+    def build_attrs(self, base_attrs, extra_attrs = None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-picker-url'] = reverse(self.url_name)
+        attrs['class'] = ' '.join(filter(None, [attrs.get('class'), 'picker']))
+        return attrs
+
+    def optgroups(self, name, value, attrs = None):
+        field = self.choices.field
+        selected = {str(v) for v in value if str(v) not in field.empty_values}
+        options = []
+        if not (self.is_required or self.allow_multiple_selected):
+            options.append(self.create_option(name, '', '', not selected, 0))
+        for obj in self.selected_objects(selected):
+            options.append(self.create_option(
+                name, field.prepare_value(obj), field.label_from_instance(obj), True, len(options), attrs = attrs
+            ))
+        return [(None, options, 0)]
+
+    def selected_objects(self, selected: set) -> list:
+        if not selected:
+            return []
+        try:
+            return list(self.choices.queryset.filter(pk__in = selected))
+        except (ValueError, ValidationError):
+            # a bound form being re-rendered with a value that is not a pk
+            return []
+
+
+class PickerSelect(PickerMixin, forms.Select):
+    pass
+
+
+class PickerSelectMultiple(PickerMixin, forms.SelectMultiple):
+    pass